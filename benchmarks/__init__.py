@@ -0,0 +1,4 @@
+"""
+Benchmarks of pyPiper. Every bench_* module is a script on its own, and ``python -m benchmarks`` runs the suite
+comparing the executors across graph shapes, payload sizes, batch sizes and skew.
+"""
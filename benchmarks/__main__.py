@@ -0,0 +1,92 @@
+"""
+Items per second, latency and peak RSS of the executors across graph shapes, payload sizes, batch sizes, uniform
+or skewed work per item and ordered or unordered outputs. The throughput of every ordered case is also shown against
+the same case without ordering. Results are written as JSON so that runs can be compared with --compare.
+
+Run from the repository root with ``python -m benchmarks``, and compare two runs with
+``python -m benchmarks --compare before.json after.json``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.suite import EXECUTORS, case_id, cases, ordering_cost, run_case
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def _fmt(value, scale=1, spec="%10.1f"):
+    return "%10s" % "-" if value is None else spec % (value * scale)
+
+
+def run(args):
+    options = {"size": args.size, "max_bytes": args.max_mb * 2 ** 20, "n_workers": args.n_workers, "cost": args.cost,
+               "timeout": args.timeout}
+    meta = {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(), "options": options}
+
+    results = []
+    print("%-44s %12s %10s %10s %10s" % ("case", "items/sec", "p50 ms", "p99 ms", "RSS MB"))
+    for case in cases(args.executors, args.full):
+        result = run_case(case, options)
+        results.append(result)
+
+        if "error" in result:
+            print("%-44s %s" % (case_id(case), result["error"]))
+        else:
+            print("%-44s %12.0f %s %s %s" % (case_id(case), result["items_per_sec"], _fmt(result["latency_p50"], 1e3),
+                                             _fmt(result["latency_p99"], 1e3), _fmt(result["peak_rss_mb"])))
+        sys.stdout.flush()
+
+    costs = ordering_cost(results)
+    if costs:
+        print()
+        print("%-44s %12s %12s %8s" % ("cost of ordered=True", "unordered", "ordered", "ratio"))
+        for key, unordered, ordered in costs:
+            print("%-44s %12.0f %12.0f %8.2f" % (key, unordered, ordered, ordered / unordered))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print("Results written to %s" % args.output)
+
+
+def compare(before, after):
+    with open(before) as f:
+        old = {case_id(r): r for r in json.load(f)["results"] if "error" not in r}
+    with open(after) as f:
+        new = {case_id(r): r for r in json.load(f)["results"] if "error" not in r}
+
+    print("%-44s %12s %12s %8s" % ("case", "before", "after", "ratio"))
+    for key in [key for key in new if key in old]:
+        a, b = old[key]["items_per_sec"], new[key]["items_per_sec"]
+        print("%-44s %12.0f %12.0f %8.2f" % (key, a, b, b / a))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--executors", nargs="+", default=["Executor", "ParallelExecutor", "ParallelExecutor2"],
+                        choices=list(EXECUTORS))
+    parser.add_argument("--full", action="store_true", help="Run every combination instead of one change at a time")
+    parser.add_argument("--size", type=int, default=20000, help="Items emitted by the root")
+    parser.add_argument("--max_mb", type=int, default=256, help="Fewer items are emitted past this many MB of payload")
+    parser.add_argument("--n_workers", type=int, default=2)
+    parser.add_argument("--cost", type=float, default=1e-5, help="Seconds of work per item")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
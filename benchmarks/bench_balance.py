@@ -0,0 +1,62 @@
+"""
+Wall clock time of ParallelExecutor2 on a skewed workload, where every few items one is much slower than the rest,
+compared with the total work divided by the number of workers.
+
+Run from the repository root with ``python -m benchmarks.bench_balance``.
+"""
+import argparse
+import time
+
+from pyPiper import Node, Pipeline
+
+
+class Count(Node):
+    def setup(self, size):
+        self.size = size
+        self.pos = 0
+
+    def run(self, data):
+        if self.pos < self.size:
+            self.emit(self.pos)
+            self.pos += 1
+        else:
+            self.close()
+
+
+class Work(Node):
+    def setup(self, fast, slow, every):
+        self.fast = fast
+        self.slow = slow
+        self.every = every
+
+    def run(self, data):
+        time.sleep(self.slow if data % self.every == 0 else self.fast)
+        self.emit(data)
+
+
+def bench(size, n_threads, chunk_size, fast, slow, every):
+    p = Pipeline(Count("gen", size=size) | Work("work", fast=fast, slow=slow, every=every), n_threads=n_threads,
+                 quiet=True, exec_name="ParallelExecutor2", chunk_size=chunk_size)
+
+    start = time.perf_counter()
+    p.run()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=400)
+    parser.add_argument("--n_threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk_size", type=int, default=1)
+    parser.add_argument("--fast", type=float, default=0.001)
+    parser.add_argument("--slow", type=float, default=0.05)
+    parser.add_argument("--every", type=int, default=8)
+    args = parser.parse_args()
+
+    n_slow = len(range(0, args.size, args.every))
+    work = n_slow * args.slow + (args.size - n_slow) * args.fast
+
+    print("%10s %10s %10s" % ("n_threads", "seconds", "ideal"))
+    for n_threads in args.n_threads:
+        seconds = bench(args.size, n_threads, args.chunk_size, args.fast, args.slow, args.every)
+        print("%10i %10.2f %10.2f" % (n_threads, seconds, work / n_threads))
@@ -0,0 +1,48 @@
+"""
+Items/sec through ParallelExecutor2 for different chunk sizes.
+
+Run from the repository root with ``python -m benchmarks.bench_chunking``.
+"""
+import argparse
+import time
+
+from pyPiper import Node, Pipeline
+
+
+class Count(Node):
+    def setup(self, size):
+        self.size = size
+        self.pos = 0
+
+    def run(self, data):
+        if self.pos < self.size:
+            self.emit(self.pos)
+            self.pos += 1
+        else:
+            self.close()
+
+
+class Increment(Node):
+    def run(self, data):
+        self.emit(data + 1)
+
+
+def bench(size, n_threads, chunk_size):
+    p = Pipeline(Count("gen", size=size) | Increment("inc"), n_threads=n_threads, quiet=True,
+                 exec_name="ParallelExecutor2", chunk_size=chunk_size)
+
+    start = time.perf_counter()
+    p.run()
+    return size / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--n_threads", type=int, default=2)
+    parser.add_argument("--chunk_sizes", type=int, nargs="+", default=[1, 16, 64, 256, 1024])
+    args = parser.parse_args()
+
+    print("%10s %14s" % ("chunk_size", "items/sec"))
+    for chunk_size in args.chunk_sizes:
+        print("%10i %14.0f" % (chunk_size, bench(args.size, args.n_threads, chunk_size)))
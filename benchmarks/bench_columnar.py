@@ -0,0 +1,65 @@
+"""
+Items/sec through the single process Executor for a chain of arithmetic nodes run one item at a time, on batches of
+Python tuples, and as columnar nodes that get each batch as a NumPy array.
+
+Run from the repository root with ``python -m benchmarks.bench_columnar``.
+"""
+import argparse
+import time
+
+from pyPiper import Node, Pipeline
+
+
+class Count(Node):
+    def setup(self, size, pull_size):
+        self.size = size
+        self.pull_size = pull_size
+        self.pos = 0
+
+    def run(self, data):
+        if self.pos < self.size:
+            end = min(self.pos + self.pull_size, self.size)
+            for i in range(self.pos, end):
+                self.emit(i)
+            self.pos = end
+        else:
+            self.close()
+
+
+class Scale(Node):
+    def setup(self, factor):
+        self.factor = factor
+
+    def run(self, data):
+        if self.columnar:
+            self.emit_batch(data * self.factor)
+        elif self.batch_size == 1:
+            self.emit(data * self.factor)
+        else:
+            for d in data:
+                self.emit(d * self.factor)
+
+
+def bench(size, depth, batch_size, columnar):
+    g = Count("gen", size=size, pull_size=batch_size)
+    for i in range(depth):
+        g = g | Scale("scale%i" % i, factor=2, batch_size=batch_size, columnar=columnar)
+
+    p = Pipeline(g, quiet=True)
+
+    start = time.perf_counter()
+    p.run()
+    return size / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--batch_size", type=int, default=4096)
+    args = parser.parse_args()
+
+    print("%-10s %14s" % ("mode", "items/sec"))
+    print("%-10s %14.0f" % ("item", bench(args.size, args.depth, 1, False)))
+    print("%-10s %14.0f" % ("tuple", bench(args.size, args.depth, args.batch_size, False)))
+    print("%-10s %14.0f" % ("columnar", bench(args.size, args.depth, args.batch_size, True)))
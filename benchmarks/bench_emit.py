@@ -0,0 +1,84 @@
+"""
+Cost of emitting through a 5 node pipeline run by the single process Executor: items/sec, and the memory held per
+item when every parcel is kept alive at the end of the graph, as measured by tracemalloc.
+
+Nodes either call emit once per item or emit_many once per batch. The "dict" rows swap in a parcel class with a
+__dict__, as parcels were before they used __slots__, to show what that saves.
+
+Run from the repository root with ``python -m benchmarks.bench_emit``.
+"""
+import argparse
+import time
+import tracemalloc
+
+import pyPiper.pyPiper
+from pyPiper import IterSource, Node, Pipeline
+
+
+class _DictParcel(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class Identity(Node):
+    def run(self, data):
+        self.emit(data)
+
+
+class IdentityMany(Node):
+    def run(self, data):
+        self.emit_many(data)
+
+
+class Hold(Node):
+    """
+    Keeps every parcel it is given until the end of the run
+    """
+    def setup(self):
+        self.batch_size = Node.BATCH_SIZE_ALL
+
+    def run(self, data):
+        self.emit_many(data)
+
+
+def graph(size, many, batch_size, hold):
+    g = IterSource("gen", iterable=range(size), pull_size=batch_size)
+    for i in range(4):
+        if many:
+            g = g | IdentityMany("n%i" % i, batch_size=batch_size)
+        else:
+            g = g | Identity("n%i" % i)
+    return g | Hold("hold") if hold else g
+
+
+def bench(size, many, batch_size, parcel):
+    original = pyPiper.pyPiper._Parcel
+    pyPiper.pyPiper._Parcel = parcel
+    try:
+        p = Pipeline(graph(size, many, batch_size, False), quiet=True)
+        start = time.perf_counter()
+        p.run()
+        rate = size / (time.perf_counter() - start)
+
+        p = Pipeline(graph(size, many, batch_size, True), quiet=True)
+        tracemalloc.start()
+        p.run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        pyPiper.pyPiper._Parcel = original
+
+    return rate, peak / size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--batch_size", type=int, default=256)
+    args = parser.parse_args()
+
+    print("%-10s %-8s %14s %12s" % ("emit", "parcel", "items/sec", "bytes/item"))
+    for many in [False, True]:
+        for name, parcel in [("dict", _DictParcel), ("slots", pyPiper.pyPiper._Parcel)]:
+            rate, nbytes = bench(args.size, many, args.batch_size, parcel)
+            print("%-10s %-8s %14.0f %12.1f" % ("emit_many" if many else "emit", name, rate, nbytes))
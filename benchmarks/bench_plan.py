@@ -0,0 +1,66 @@
+"""
+Per-parcel overhead of the single process Executor.
+
+Every node does no work, so the time per item per hop is the cost of moving a parcel through the graph. Each graph
+is run with and without fusing its chain of nodes.
+Run from the repository root with ``python -m benchmarks.bench_plan``.
+"""
+import argparse
+import time
+
+from pyPiper import Node, Pipeline
+
+
+class Count(Node):
+    def setup(self, size):
+        self.size = size
+        self.pos = 0
+
+    def run(self, data):
+        if self.pos < self.size:
+            self.emit(self.pos)
+            self.pos += 1
+        else:
+            self.close()
+
+
+class Identity(Node):
+    def run(self, data):
+        self.emit(data)
+
+
+def chain(size, depth):
+    g = Count("gen", size=size)
+    for i in range(depth):
+        g = g | Identity("n%i" % i)
+    return g
+
+
+def streams(size, depth):
+    g = Count("gen", size=size, out_streams="num")
+    for i in range(depth):
+        g = g | Identity("n%i" % i, in_streams="num", out_streams="num")
+    return g
+
+
+def bench(graph, size, depth, fuse):
+    p = Pipeline(graph, quiet=True, fuse=fuse)
+
+    start = time.perf_counter()
+    p.run()
+    elapsed = time.perf_counter() - start
+
+    return elapsed / (size * (depth + 1)) * 1e9
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--depth", type=int, default=4)
+    args = parser.parse_args()
+
+    print("%-10s %12s %12s" % ("graph", "ns/item/hop", "fused"))
+    for name, make in [("chain", chain), ("streams", streams)]:
+        unfused = bench(make(args.size, args.depth), args.size, args.depth, False)
+        fused = bench(make(args.size, args.depth), args.size, args.depth, True)
+        print("%-10s %12.0f %12.0f" % (name, unfused, fused))
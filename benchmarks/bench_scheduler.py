@@ -0,0 +1,63 @@
+"""
+Executor throughput with a trickle source as the graph grows.
+
+The root only emits on one call in ``every``, so most steps have nothing to move. The cost of those idle steps should
+not depend on the number of nodes in the graph. Run from the repository root with
+``python -m benchmarks.bench_scheduler``.
+"""
+import argparse
+import time
+
+from pyPiper import Node, NodeGraph, Pipeline
+
+
+class Trickle(Node):
+    def setup(self, calls, every):
+        self.calls = calls
+        self.every = every
+        self.pos = 0
+
+    def run(self, data):
+        if self.pos < self.calls:
+            if self.pos % self.every == 0:
+                self.emit(self.pos)
+            self.pos += 1
+        else:
+            self.close()
+
+
+class Identity(Node):
+    def run(self, data):
+        self.emit(data)
+
+
+def deep(n_nodes, calls, every):
+    g = NodeGraph(Trickle("gen", calls=calls, every=every))
+    for i in range(n_nodes - 1):
+        g = g | Identity("n%i" % i)
+    return g
+
+
+def wide(n_nodes, calls, every):
+    return Trickle("gen", calls=calls, every=every) | [Identity("n%i" % i) for i in range(n_nodes - 1)]
+
+
+def bench(graph, calls):
+    p = Pipeline(graph, quiet=True)
+
+    start = time.perf_counter()
+    p.run()
+    return calls / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--every", type=int, default=1000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500])
+    args = parser.parse_args()
+
+    print("%-6s %6s %14s" % ("shape", "nodes", "root calls/sec"))
+    for name, build in (("deep", deep), ("wide", wide)):
+        for n_nodes in args.sizes:
+            print("%-6s %6i %14.0f" % (name, n_nodes, bench(build(n_nodes, args.calls, args.every), args.calls)))
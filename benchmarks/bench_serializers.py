@@ -0,0 +1,70 @@
+"""
+Bytes sent through a worker queue per chunk and items/sec through ParallelExecutor2 for each serializer, with small
+records, text and NumPy arrays as payloads.
+
+Run from the repository root with ``python -m benchmarks.bench_serializers``.
+"""
+import argparse
+import time
+from multiprocessing.reduction import ForkingPickler
+
+from pyPiper import IterSource, Node, Pipeline
+from pyPiper.pyPiper import _Parcel
+from pyPiper.serializers import get_serializer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Identity(Node):
+    def run(self, data):
+        self.emit(data)
+
+
+def payloads(size):
+    result = {
+        "records": [(i, "name-%i" % i, i * 0.5) for i in range(size)],
+        "text": [("line %i of some log file that repeats itself a lot " % i) * 20 for i in range(size)],
+    }
+    if numpy is not None:
+        result["arrays"] = [numpy.full(2 ** 14, i, dtype=numpy.float32) for i in range(size)]
+    return result
+
+
+def wire_bytes(items, serializer, chunk_size):
+    chunk = items[:chunk_size]
+    if serializer is None:
+        payload = [_Parcel(item) for item in chunk]
+    else:
+        payload = serializer.dumps(chunk)
+
+    # This is what the queue pickles and writes to the pipe
+    return len(ForkingPickler.dumps(payload))
+
+
+def bench(items, serializer, n_threads, chunk_size):
+    p = Pipeline(IterSource("gen", iterable=items) | Identity("identity"), n_threads=n_threads, quiet=True,
+                 exec_name="ParallelExecutor2", chunk_size=chunk_size, serializer=serializer)
+
+    start = time.perf_counter()
+    p.run()
+    return len(items) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--n_threads", type=int, default=2)
+    parser.add_argument("--chunk_size", type=int, default=64)
+    parser.add_argument("--serializers", nargs="+", default=["default", "tuple", "pickle5", "zlib"])
+    args = parser.parse_args()
+
+    print("%10s %10s %14s %14s" % ("payload", "serializer", "bytes/chunk", "items/sec"))
+    for name, items in payloads(args.size).items():
+        for serializer in args.serializers:
+            serializer = None if serializer == "default" else serializer
+            nbytes = wire_bytes(items, get_serializer(serializer), args.chunk_size)
+            rate = bench(items, serializer, args.n_threads, args.chunk_size)
+            print("%10s %10s %14i %14.0f" % (name, serializer or "default", nbytes, rate))
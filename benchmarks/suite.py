@@ -0,0 +1,247 @@
+"""
+Cases of the benchmark suite and how one is measured. See benchmarks/__main__.py to run them.
+"""
+import itertools
+import multiprocessing
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from pyPiper import Node, Pipeline
+
+# Pipeline arguments selecting each executor, as (exec_name, n_threads) given the number of workers. Any exec_name
+# with one thread runs on Executor
+EXECUTORS = {
+    "Executor": lambda n_workers: ("ParallelExecutor2", 1),
+    "ParallelExecutor": lambda n_workers: ("ParallelExecutor", n_workers),
+    "ParallelExecutor2": lambda n_workers: ("ParallelExecutor2", n_workers),
+    "thread": lambda n_workers: ("thread", n_workers),
+    "async": lambda n_workers: ("async", 1),
+    "stage": lambda n_workers: ("stage", 1),
+}
+
+SHAPES = ["linear", "fanout", "deep", "wide"]
+
+# Bytes per item, 0 for ints
+PAYLOADS = {"int": 0, "1KB": 2 ** 10, "64KB": 2 ** 16, "1MB": 2 ** 20}
+
+BATCH_SIZES = [1, 64]
+
+# Cost of one item in 10 relative to the others. 1 is uniform
+SKEWS = [1, 10]
+
+# Executors that can be asked to keep outputs in order. Outputs of Executor always are
+ORDERED_EXECUTORS = ("ParallelExecutor", "ParallelExecutor2")
+
+BASELINE = {"shape": "linear", "payload": "int", "batch_size": 1, "skew": 1, "ordered": False}
+
+
+class Payloads(Node):
+    """
+    Emits size items of nbytes bytes each, as NumPy arrays when NumPy is installed, or ints if nbytes is 0
+    """
+    def setup(self, size, nbytes, pull_size=64):
+        self.size = size
+        self.pos = 0
+        self.pull_size = pull_size
+
+        if nbytes == 0:
+            self.payload = None
+        elif numpy is not None:
+            self.payload = numpy.ones(nbytes, dtype=numpy.uint8)
+        else:
+            self.payload = bytes(nbytes)
+
+    def run(self, data):
+        if self.pos >= self.size:
+            self.close()
+            return
+
+        end = min(self.pos + self.pull_size, self.size)
+        if self.payload is None:
+            self.emit_many(range(self.pos, end))
+        else:
+            self.emit_many(self.payload for i in range(self.pos, end))
+        self.pos = end
+
+
+class Work(Node):
+    """
+    Spins for cost seconds per item, and for skew times as long on every tenth item it is given, then emits it
+    """
+    def setup(self, cost=0.0, skew=1):
+        self.cost = cost
+        self.skew = skew
+        self.n = 0
+
+    def _spin(self, n_items):
+        if self.cost == 0:
+            return
+
+        seconds = 0.0
+        for i in range(n_items):
+            self.n += 1
+            seconds += self.cost * (self.skew if self.n % 10 == 0 else 1)
+
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def run(self, data):
+        if self.batch_size == 1:
+            self._spin(1)
+            self.emit(data)
+        else:
+            self._spin(len(data))
+            self.emit_many(data)
+
+
+def graph(shape, size, nbytes, batch_size, cost, skew):
+    """
+    linear: the root, one working node and a sink. fanout: 4 branches of a working node and a sink. deep: a chain of
+    16 nodes, the first of them working. wide: 32 successors of the root, the first of them working
+    """
+    gen = Payloads("gen", size=size, nbytes=nbytes)
+
+    def work(name):
+        return Work(name, cost=cost, skew=skew, batch_size=batch_size)
+
+    def identity(name):
+        return Work(name, batch_size=batch_size)
+
+    if shape == "linear":
+        return gen | work("work") | identity("sink")
+    elif shape == "fanout":
+        return gen | [work("work%i" % i) | identity("sink%i" % i) for i in range(4)]
+    elif shape == "deep":
+        g = gen | work("n0")
+        for i in range(1, 16):
+            g = g | identity("n%i" % i)
+        return g
+    elif shape == "wide":
+        return gen | ([work("n0")] + [identity("n%i" % i) for i in range(1, 32)])
+    else:
+        raise Exception("Unknown shape %s" % shape)
+
+
+def cases(executors, full=False):
+    """
+    Returns the cases to run for every executor. By default every dimension is varied on its own from BASELINE, so the
+    number of cases grows with the sum of the choices instead of their product. With full, every combination is run
+    """
+    dimensions = [("shape", SHAPES), ("payload", list(PAYLOADS)), ("batch_size", BATCH_SIZES), ("skew", SKEWS),
+                  ("ordered", [False, True])]
+
+    if full:
+        combinations = [dict(zip([k for k, v in dimensions], values))
+                        for values in itertools.product(*[v for k, v in dimensions])]
+    else:
+        combinations = [dict(BASELINE)]
+        for key, values in dimensions:
+            combinations += [dict(BASELINE, **{key: value}) for value in values if value != BASELINE[key]]
+
+    return [dict(case, executor=executor) for executor in executors for case in combinations
+            if executor in ORDERED_EXECUTORS or not case["ordered"]]
+
+
+def case_id(case):
+    result = "%(executor)s/%(shape)s/%(payload)s/b%(batch_size)s/s%(skew)s" % case
+    return result + "/ordered" if case.get("ordered") else result
+
+
+def ordering_cost(results):
+    """
+    Returns (case id, items per second without ordering, items per second with it) for every ordered case of results
+    that was also run without ordering
+    """
+    unordered = {case_id(r): r for r in results if not r.get("ordered") and "error" not in r}
+    costs = []
+    for r in results:
+        if r.get("ordered") and "error" not in r:
+            other = unordered.get(case_id(dict(r, ordered=False)))
+            if other is not None:
+                costs.append((case_id(r), other["items_per_sec"], r["items_per_sec"]))
+    return costs
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+
+    # Workers are children of the process running the case, and have been waited for by the time this is called
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _measure(case, options, out):
+    try:
+        out.put(measure(case, options))
+    except Exception as e:
+        out.put(dict(case, error="%s: %s" % (type(e).__name__, e)))
+
+
+def measure(case, options):
+    """
+    Runs case and returns it with its items per second, peak RSS in MB and latency percentiles in seconds
+    """
+    nbytes = PAYLOADS[case["payload"]]
+    # Keep the bytes sent through the graph about the same whatever the payload
+    size = options["size"] if nbytes == 0 else max(8, min(options["size"], options["max_bytes"] // nbytes))
+
+    exec_name, n_threads = EXECUTORS[case["executor"]](options["n_workers"])
+
+    def make(**kwargs):
+        if exec_name == "ParallelExecutor2" and n_threads > 1:
+            # Ordered runs need chunks of at least a batch, and unordered runs are given the same chunks to compare with
+            kwargs["chunk_size"] = case["batch_size"]
+        if case["ordered"]:
+            kwargs["ordered"] = True
+        g = graph(case["shape"], size, nbytes, case["batch_size"], options["cost"], case["skew"])
+        return Pipeline(g, n_threads=n_threads, exec_name=exec_name, quiet=True, **kwargs)
+
+    p = make()
+    start = time.perf_counter()
+    p.run()
+    seconds = time.perf_counter() - start
+    peak_rss = _peak_rss_mb()
+
+    # Latency is measured on a second, traced run, so tracing does not slow down the run that gives the throughput
+    latency = {"latency_p50": None, "latency_p99": None}
+    if exec_name != "stage":
+        p = make(trace=True)
+        p.run()
+        # Latency adds up along the graph, so the largest of any node is that of the slowest path through it
+        stats = p.stats().values()
+        for key in latency:
+            values = [s[key] for s in stats if s[key] is not None]
+            latency[key] = max(values) if values else None
+
+    return dict(case, items=size, seconds=seconds, items_per_sec=size / seconds, peak_rss_mb=peak_rss, **latency)
+
+
+def run_case(case, options):
+    """
+    Runs case in a process of its own, so its peak RSS is its own, and returns what was measured
+    """
+    out = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_measure, args=(case, options, out))
+    p.start()
+    try:
+        result = out.get(timeout=options["timeout"])
+    except Exception:
+        result = dict(case, error="did not finish within %s seconds" % options["timeout"])
+    p.join(1)
+    if p.is_alive():
+        p.terminate()
+    return result
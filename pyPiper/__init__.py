@@ -1 +1,5 @@
 from .pyPiper import Node, NodeGraph, Pipeline
+from .sources import Source, IterSource, LineSource
+from .pool import WorkerPool
+from .adaptive import AdaptiveBatch
+from .profiling import Profiler, CProfiler
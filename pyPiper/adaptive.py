@@ -0,0 +1,68 @@
+class AdaptiveBatch(object):
+    """
+    Adjusts the batch_size of a node while it runs, from the time its calls take. With a target_latency, the batch
+    size is set so one call takes about that long. Without one, the batch size is doubled for as long as that lowers
+    the time spent per item, and then kept at the size that had the lowest.
+
+    A batch never grows past the number of items that were waiting when it was taken, so a node is not left waiting
+    for input that does not arrive fast enough, and it changes by at most a factor of 2 per call.
+    """
+    # Weight of the newest measurement in the running averages
+    SMOOTHING = 0.3
+
+    def __init__(self, min_size=1, max_size=1024, target_latency=None):
+        """
+        :param min_size: Smallest batch size to use
+        :type min_size: int
+        :param max_size: Largest batch size to use
+        :type max_size: int
+        :param target_latency: Seconds one call of the node should take. If None, the batch size with the lowest time
+        per item is used
+        :type target_latency: float
+        """
+        if not 1 <= min_size <= max_size:
+            raise Exception("Expected 1 <= min_size <= max_size. Got %s and %s" % (min_size, max_size))
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+
+        self.size = min_size
+        self._cost = None
+        self._costs = {}
+
+    def start(self, size):
+        """
+        Sets the batch size to start from, within the bounds, and returns it
+        """
+        self.size = min(max(int(size), self.min_size), self.max_size)
+        return self.size
+
+    def update(self, n_items, seconds, waiting):
+        """
+        Records that a call on n_items took seconds, when waiting items had been taken for the node, and returns the
+        batch size to use next
+        """
+        if n_items == 0:
+            return self.size
+
+        cost = seconds / n_items
+        if self.target_latency is not None:
+            self._cost = cost if self._cost is None else self._cost + self.SMOOTHING * (cost - self._cost)
+            wanted = self.target_latency / max(self._cost, 1e-9)
+        else:
+            # Only a batch of the current size tells what that size costs
+            if n_items != self.size:
+                return self.size
+
+            previous = self._costs.get(self.size)
+            self._costs[self.size] = cost if previous is None else previous + self.SMOOTHING * (cost - previous)
+
+            wanted = min(self._costs, key=self._costs.get)
+            if wanted == self.size and self.size * 2 not in self._costs:
+                wanted = self.size * 2
+
+        wanted = min(wanted, self.size * 2, max(self.size, waiting))
+        wanted = max(wanted, self.size / 2)
+        self.size = min(max(int(wanted), self.min_size), self.max_size)
+        return self.size
@@ -1,64 +1,357 @@
+import asyncio
+import copy
 import ctypes
+import inspect
 import multiprocessing
+import multiprocessing.connection
 import os
 import queue
+import sys
+import threading
 import time
 from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from abc import ABC, abstractmethod
 from functools import reduce
+from heapq import heappop, heappush
 from itertools import islice
 
 from multiprocessing import Pool, Manager, Queue
 from multiprocessing.pool import ApplyResult, AsyncResult
 from queue import Empty
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyPiper.metrics import NodeStats, merge_stats
+from pyPiper.plan import ExecutionPlan
+from pyPiper.profiling import _label_calls
+from pyPiper.serializers import get_serializer
+from pyPiper.transport import SharedMemoryTransport
+
 STATE_RUNNING = 1
 STATE_CLOSING = 2
 STATE_CLOSED = 3
 
-def _filter_data_stream(node, next_node, parcels):
-    to_push = []
+_CLOSE_SIGNAL = "close"
+_STOP_SIGNAL = "stop"
+# Tags the report a worker sends at the end of a run, as (_REPORT_SIGNAL, report)
+_REPORT_SIGNAL = "report"
+# Tags the results of one chunk when outputs are kept in order, as (_CHUNK_SIGNAL, sequence number, results)
+_CHUNK_SIGNAL = "chunk"
+
+def _encode_parcels(serializer, parcels, traced=False):
+    payload = serializer.dumps([parcel.data for parcel in parcels])
+    if traced:
+        # Only the items are serialized, so send the times the root emitted them alongside
+        return payload, [parcel.origin for parcel in parcels]
+    return payload
+
+def _decode_parcels(serializer, payload, traced=False):
+    # Imported here since pyPiper.pyPiper imports this module
+    from pyPiper.pyPiper import _Parcel
+    if not traced:
+        return list(map(_Parcel, serializer.loads(payload)))
+
+    payload, origins = payload
+    parcels = list(map(_Parcel, serializer.loads(payload)))
+    for parcel, origin in zip(parcels, origins):
+        parcel.origin = origin
+    return parcels
+
+def _approx_size(data):
+    if isinstance(data, (bytes, bytearray, str)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+
+    nbytes = getattr(data, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    return sys.getsizeof(data)
+
+
+class _ChunkBuffer(object):
+    """
+    Gathers parcels on the sending side of a process queue so they can be shipped as one chunk. A chunk is ready
+    once it holds max_items parcels, once its approximate payload reaches max_bytes, or once its oldest parcel has
+    waited max_latency seconds.
+    """
+    def __init__(self, max_items=1, max_bytes=None, max_latency=None):
+        if max_items < 1:
+            raise Exception("chunk_size must be >= 1. Got %s" % max_items)
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+
+        self.parcels = []
+        self.nbytes = 0
+        self.started = 0
+
+    def __len__(self):
+        return len(self.parcels)
+
+    def add(self, parcel):
+        if not self.parcels:
+            self.started = time.monotonic()
+        self.parcels.append(parcel)
+
+        if self.max_bytes is not None:
+            self.nbytes += _approx_size(parcel.data)
+            if self.nbytes >= self.max_bytes:
+                return True
+
+        return len(self.parcels) >= self.max_items
+
+    def expired(self):
+        if not self.parcels or self.max_latency is None:
+            return False
 
-    for parcel in parcels:
-        data = parcel.data
+        return time.monotonic() - self.started >= self.max_latency
 
-        if next_node.in_streams == "*":
-            to_push.append(data)
-        else:
-            if not isinstance(data, (list, tuple)):
-                data = [data]
-
-            if node.out_streams == "*":
-                if len(data) != len(next_node.in_streams):
-                    raise Exception(
-                        "Node %s emits %i items, but next node (%s) expects %i" % (node, len(data), node, node.in_streams))
-                to_push = data
+    def take(self):
+        chunk = self.parcels
+        self.parcels = []
+        self.nbytes = 0
+        return chunk
+
+
+class _Arrivals(object):
+    """
+    Arrival times of the items queued for a node, kept per group of items that arrived together, so the age of the
+    oldest one is known without a timestamp per item
+    """
+    def __init__(self):
+        self.groups = deque()
+
+    def add(self, n, now):
+        if n:
+            self.groups.append([n, now])
+
+    def take(self, n):
+        groups = self.groups
+        while n > 0 and groups:
+            if groups[0][0] <= n:
+                n -= groups.popleft()[0]
             else:
-                for k in next_node.in_streams:
-                    to_push.append(data[node.out_streams.index(k)])
+                groups[0][0] -= n
+                n = 0
+
+    def oldest(self):
+        return self.groups[0][1] if self.groups else None
+
+
+def _timed(node):
+    if node.max_batch_latency is None or node.batch_size == float("inf"):
+        return False
+    return node.batch_size > 1 or node.adaptive is not None
+
+
+def _check_ordered(graph, chunk_size=None):
+    """
+    Raises if the outputs of graph cannot be kept in order. Nodes with batch_size Node.BATCH_SIZE_ALL only run once the
+    root closes, on whatever each worker was given, and a batch_size larger than chunk_size would cut every batch short
+    """
+    for node in graph:
+        if node is graph._root:
+            continue
+
+        if node.batch_size == float("inf"):
+            raise Exception("ordered cannot be used with %s, whose batch_size is Node.BATCH_SIZE_ALL" % node.name)
+        if chunk_size is not None and node.batch_size > chunk_size:
+            raise Exception("ordered needs a chunk_size of at least the batch_size of every node. %s has batch_size %s "
+                            "and chunk_size is %s" % (node.name, node.batch_size, chunk_size))
+
+
+def _call_root(root):
+    stats = root._stats
+    if stats is None:
+        return root._run(None)
+
+    emitted = len(root._output_buffer)
+    start = time.perf_counter()
+    result = root._run(None)
+    stats.record(0, len(root._output_buffer) - emitted, time.perf_counter() - start)
+
+    if stats.latency is not None:
+        _stamp(root, emitted, time.monotonic())
+    return result
+
 
-    return to_push
+def _stamp(node, emitted, origin):
+    # Parcels a node emitted carry the time the root emitted the oldest item they came from
+    buffer = node._output_buffer
+    for k in range(emitted, len(buffer)):
+        buffer[k].origin = origin
+
+
+class _TracedItems(list):
+    """
+    Items taken off an edge while tracing, with the time the root emitted the item each of them came from and the time
+    each was queued
+    """
+    __slots__ = ("origins", "queued")
+
+
+def _start_profile(profiler, nodes):
+    if profiler is None:
+        return None
+
+    _label_calls(nodes)
+    profiler = copy.copy(profiler)
+    profiler.start()
+    return profiler
+
+
+def _stop_profile(profiler, report):
+    if profiler is not None:
+        profiler.stop()
+        report["profile"] = profiler.result()
 
 
 class BaseExecutor(ABC):
-    def __init__(self, graph, quiet=False):
+    def __init__(self, graph, quiet=False, stats=False, trace=False):
+        """
+        :param stats: If True, calls, items and run times of every node are recorded. See stats
+        :type stats: bool
+        :param trace: If True, stats are recorded along with how long every item waits on each edge and how long after
+        the root emitted it each node is done with it
+        :type trace: bool
+        """
         self.graph = graph
         self.quiet = quiet
 
+        # Every executor of a run records into fresh NodeStats, so nodes sent to workers start from zero
+        self.collect_stats = stats or trace
+        self.trace = trace
+        for node in graph:
+            node._stats = NodeStats(trace) if self.collect_stats else None
+
         self.update_callback = None
         self.use_callback = False
 
         self.progress_max = 0
         self.progress_current = 0
 
+        self.collect = False
+        self._results = []
+
+        # What worker processes reported about their copy of the graph at the end of the run
+        self._reports = []
+
+        # Profiler that worker processes and threads profile with a copy of, and results of copies not reported
+        self.profiler = None
+        self._profiles = []
+        self._thread_profilers = {}
+
     def print_buffer(self, buffer):
         if not self.quiet and buffer:
             for parcel in buffer:
                 print(parcel.data)
 
-    @staticmethod
-    def get_key(node, successor):
-        return "%s%s" % (node, successor)
+    def _sink(self, node, parcels):
+        if self.collect:
+            name = node.name
+            self._results.extend([(name, parcel.data) for parcel in parcels])
+        else:
+            self.print_buffer(parcels)
+
+    def take_results(self):
+        results = self._results
+        self._results = []
+        return results
+
+    def _wants_reports(self):
+        return self.collect_stats or self.profiler is not None or any(node.adaptive is not None for node in self.graph
+                                         if node is not self.graph._root)
+
+    def report(self):
+        """
+        Returns what the parent process needs to know about this executor's copy of the graph once it has run
+        """
+        return {"batch_sizes": {node.name: node.batch_size for node in self.graph if node.adaptive is not None},
+                "stats": self._node_stats()}
+
+    def _node_stats(self):
+        return {node.name: node._stats for node in self.graph if node._stats is not None}
+
+    def _local_nodes(self):
+        """
+        Returns the nodes this process runs. Other nodes run in worker processes
+        """
+        return [self.graph._root]
+
+    def profile_results(self):
+        """
+        Returns the results of the profiler copies used by worker processes and threads during the run
+        """
+        results = [report["profile"] for report in self._reports if "profile" in report] + self._profiles
+        return results + [profiler.result() for profiler in self._thread_profilers.values()]
+
+    def _call(self, fn, *args):
+        """
+        Calls fn from a thread other than the one the run was started from, profiled when the run is
+        """
+        # cProfile only sees the thread it was started in before Python 3.12, so every thread profiles with a copy of
+        # its own. From 3.12 on, the profiler of the parent sees every thread
+        if self.profiler is None or sys.version_info >= (3, 12):
+            return fn(*args)
+
+        # Only the thread itself adds its entry, so no lock is needed
+        ident = threading.get_ident()
+        profiler = self._thread_profilers.get(ident)
+        if profiler is None:
+            profiler = self._thread_profilers[ident] = copy.copy(self.profiler)
+
+        profiler.start()
+        try:
+            return fn(*args)
+        finally:
+            profiler.stop()
+
+    def stats(self):
+        """
+        Returns what was recorded about every node by node name, as a dict of calls, items_in, items_out, time (total
+        seconds spent in run), time_p50, time_p90, time_p99 and time_max (seconds per call) and max_queued (the most
+        items queued for the node at once). The numbers of nodes run by several processes or threads are added up,
+        except for max_queued and time_max, which are the largest of them.
+        """
+        if not self.collect_stats:
+            raise Exception("Stats were not recorded. Pass stats=True to record them")
+
+        parts = [self._node_stats()] + [report.get("stats", {}) for report in self._reports]
+        return {name: stats.as_dict() for name, stats in merge_stats(parts).items()}
+
+    def batch_sizes(self):
+        """
+        Returns the batch size that nodes with an adaptive batch size ended the run with, by node name. When several
+        processes ran a node, the median of the sizes they ended with is given
+        """
+        if not self._reports:
+            return self.report()["batch_sizes"]
+
+        sizes = {}
+        for report in self._reports:
+            for name, size in report.get("batch_sizes", {}).items():
+                sizes.setdefault(name, []).append(size)
+
+        return {name: sorted(values)[len(values) // 2] for name, values in sizes.items()}
+
+    def _take_reports(self, q, n, processes, block=True):
+        """
+        Reads the reports worker processes send at the end of a run. Unless block is False, waits until n have
+        arrived or no worker that could still send one is alive
+        """
+        while len(self._reports) < n:
+            try:
+                self._reports.append((q.get(timeout=0.1) if block else q.get_nowait())[1])
+            except Empty:
+                if not block or not any(p.is_alive() for p in processes):
+                    return
 
     @abstractmethod
     def _run_root(self):
@@ -91,94 +384,827 @@ class BaseExecutor(ABC):
 
             self.update_progress()
 
+    def iter_results(self, update_callback=None):
+        """
+        Runs the graph and yields (sink name, data) for every output of a sink node instead of printing it. Outputs
+        are handed over after every step, so only one step's worth of results is held at a time.
+        """
+        self.collect = True
+        self._init_update(update_callback)
+
+        while not self.is_finished():
+            self._run_root()
+            self._step()
+
+            self.update_progress()
+
+            yield from self.take_results()
+
 
 class Executor(BaseExecutor):
-    def __init__(self, graph, quiet=False):
-        super().__init__(graph, quiet)
-        self.queues = {}
+    def __init__(self, graph, quiet=False, edge_capacity=None, edge_capacity_bytes=None, max_buffered=None,
+                 memory_budget=None, stats=False, trace=False):
+        """
+        Limits are soft: a node is not run while one of its out edges is full and the root is not run while the
+        graph is over budget, but a single call may overshoot. An edge always has room for one batch of its
+        successor, and edges into nodes with batch_size Node.BATCH_SIZE_ALL are never limited.
+
+        :param edge_capacity: Maximum number of items queued on one edge
+        :type edge_capacity: int
+        :param edge_capacity_bytes: Maximum approximate size in bytes of the items queued on one edge
+        :type edge_capacity_bytes: int
+        :param max_buffered: Maximum number of items queued across all edges
+        :type max_buffered: int
+        :param memory_budget: Maximum approximate size in bytes of the items queued across all edges
+        :type memory_budget: int
+        """
+        super().__init__(graph, quiet, stats, trace)
+        self.plan = ExecutionPlan(graph)
+        self.queues = [deque() for e in range(self.plan.n_edges)]
+
+        # When tracing, (time the root emitted it, time it was queued) for every item queued on an edge, in order
+        self._traces = [deque() for e in range(self.plan.n_edges)] if trace else None
         self.total_done = 0
 
-        for node in graph._node_list:
-            for successor in graph._graph[node]:
-                self.queues[self.get_key(node, successor)] = deque()
+        self.edge_capacity = edge_capacity
+        self.edge_capacity_bytes = edge_capacity_bytes
+        self.max_buffered = max_buffered
+        self.memory_budget = memory_budget
+
+        self._limited = any(x is not None for x in (edge_capacity, edge_capacity_bytes, max_buffered, memory_budget))
+        self._track_bytes = edge_capacity_bytes is not None or memory_budget is not None
+        self._edge_bytes = [0] * self.plan.n_edges
+        self._buffered = 0
+        self._buffered_bytes = 0
+        self._deferred = []
+
+        # Nodes with work to do: an out edge holding a full batch for its successor, or a close to propagate.
+        # Popping the heap visits them in topological order, so one step still pushes data all the way through.
+        self._ready = []
+        self._scheduled = [False] * self.plan.n_nodes
+        self._flushed = [False] * self.plan.n_nodes
+        self._n_finished = 0
+
+        # Edges into nodes with a max_batch_latency, which run a partial batch once its oldest item is that old
+        plan = self.plan
+        self._timed_edges = tuple(e for e in range(plan.n_edges) if _timed(plan.nodes[plan.edge_dst[e]]))
+        self._arrivals = [_Arrivals() if e in self._timed_edges else None for e in range(plan.n_edges)]
+        self._due = [False] * plan.n_edges
+
+    def _local_nodes(self):
+        return list(self.plan.nodes)
+
+    def push_root(self, parcels):
+        self._forward(0, parcels)
+
+    def _schedule(self, i):
+        if not self._scheduled[i]:
+            self._scheduled[i] = True
+            heappush(self._ready, i)
+
+    def _forward(self, i, parcels):
+        plan = self.plan
+        out_edges = plan.out_edges[i]
+
+        if not out_edges:
+            self._sink(plan.nodes[i], parcels)
+            return
+
+        values = [parcel.data for parcel in parcels]
+        if self.trace:
+            now = time.monotonic()
+            origins = [getattr(parcel, "origin", now) for parcel in parcels]
+
+        for e in out_edges:
+            queue = self.queues[e]
+            items = plan.project(e, values)
+            queue.extend(items)
+
+            if self.trace:
+                self._add_traces(e, i, origins, len(items) // max(len(values), 1), now)
+
+            if self._limited:
+                self._account(e, items, 1)
+
+            if self._arrivals[e] is not None:
+                self._arrivals[e].add(len(items), time.monotonic())
+
+            if self.collect_stats:
+                plan.nodes[plan.edge_dst[e]]._stats.queued(len(queue))
+
+            if len(queue) >= plan.nodes[plan.edge_dst[e]].batch_size:
+                self._schedule(i)
+
+    def _add_traces(self, e, i, origins, per_value, now):
+        # Items from the root count as queued from when it emitted them, which in a worker process includes their
+        # trip from the parent
+        if i == 0:
+            traces = [(origin, origin) for origin in origins]
+        else:
+            traces = [(origin, now) for origin in origins]
+
+        if per_value != 1:
+            traces = [t for t in traces for k in range(per_value)]
+        self._traces[e].extend(traces)
+
+    def _take_traces(self, e, data):
+        traces = self._traces[e]
+        popped = [traces.popleft() for k in range(len(data))]
+
+        result = _TracedItems(data)
+        result.origins = [origin for origin, queued in popped]
+        result.queued = [queued for origin, queued in popped]
+        return result
+
+    def _account(self, e, items, sign):
+        self._buffered += sign * len(items)
+
+        if self._track_bytes:
+            nbytes = sign * sum(_approx_size(d) for d in items)
+            self._edge_bytes[e] += nbytes
+            self._buffered_bytes += nbytes
+
+    def _is_full(self, e):
+        batch_size = self.plan.nodes[self.plan.edge_dst[e]].batch_size
+        if batch_size == float("inf"):
+            return False
+
+        n = len(self.queues[e])
+        if n < batch_size:
+            return False
+
+        if self.edge_capacity is not None and n >= self.edge_capacity:
+            return True
+
+        return self.edge_capacity_bytes is not None and self._edge_bytes[e] >= self.edge_capacity_bytes
+
+    def _is_blocked(self, i):
+        for e in self.plan.out_edges[i]:
+            if self._is_full(e):
+                return True
+        return False
 
-    def send(self, node, successor, data):
-        self.queues[self.get_key(node, successor)].append(data)
+    def can_pull(self):
+        """
+        Returns False when the root should not be run because the graph is holding too much data. If no node is
+        waiting for room downstream, pulling more input is the only way to make progress and is always allowed.
+        """
+        if not self._limited or not self._deferred:
+            return True
 
-    def get_data_to_push(self, node, successor):
-        queue = self.queues[self.get_key(node, successor)]
+        if self.max_buffered is not None and self._buffered >= self.max_buffered:
+            return False
+
+        if self.memory_budget is not None and self._buffered_bytes >= self.memory_budget:
+            return False
+
+        return not self._is_blocked(0)
+
+    def is_finished(self):
+        nodes = self.plan.nodes
+        while self._n_finished < len(nodes) and nodes[self._n_finished]._state == STATE_CLOSED:
+            self._n_finished += 1
+
+        return self._n_finished == len(nodes)
+
+    def get_data_to_push(self, e, node, successor):
+        # Take every complete batch. A node is only scheduled again once more data arrives, which for a worker's copy
+        # of the graph may never happen
+        return self._pop_batch(e, successor, node._state == node.STATE_CLOSED, whole=True)
+
+    def _pop_batch(self, e, successor, flush, whole=False):
+        queue = self.queues[e]
 
-        if node._state != node.STATE_CLOSED:
+        if self._due[e]:
+            self._due[e] = False
+            flush = True
+
+        if not flush:
             size = successor.batch_size
+            if whole and size != float("inf"):
+                size = len(queue) - len(queue) % size
         else:
             size = len(queue)
 
-        if len(queue) >= size:
-            return [queue.popleft() for x in range(size)]
+        if size and len(queue) >= size:
+            if size == len(queue):
+                data = list(queue)
+                queue.clear()
+            else:
+                data = [queue.popleft() for x in range(size)]
+
+            if self._limited:
+                self._account(e, data, -1)
+            if self._arrivals[e] is not None:
+                self._arrivals[e].take(len(data))
+            if self.trace:
+                data = self._take_traces(e, data)
+            return data
 
         return None
 
+    def _check_deadlines(self, force=False):
+        """
+        Marks the edges whose oldest queued item has waited max_batch_latency, or every edge holding a partial batch
+        if force is True, so the next pop takes whatever they hold
+        """
+        plan = self.plan
+        now = time.monotonic()
+        for e in self._timed_edges:
+            oldest = self._arrivals[e].oldest()
+            if oldest is not None and (force or now - oldest >= plan.nodes[plan.edge_dst[e]].max_batch_latency):
+                self._due[e] = True
+                self._schedule(plan.edge_src[e])
+
+    def next_deadline(self):
+        """
+        Returns the number of seconds until a partial batch is due, or None if no partial batch is waiting on a
+        max_batch_latency
+        """
+        plan = self.plan
+        result = None
+        now = time.monotonic()
+        for e in self._timed_edges:
+            oldest = self._arrivals[e].oldest()
+            if oldest is not None:
+                left = max(0, oldest + plan.nodes[plan.edge_dst[e]].max_batch_latency - now)
+                result = left if result is None else min(result, left)
+
+        return result
+
+    def _flush(self):
+        """
+        Runs every partial batch queued in the graph, and the partial batches that makes, until the only items left
+        are queued for nodes with batch_size Node.BATCH_SIZE_ALL
+        """
+        plan = self.plan
+        while True:
+            edges = [e for e in range(plan.n_edges)
+                     if self.queues[e] and plan.nodes[plan.edge_dst[e]].batch_size != float("inf")]
+            if not edges:
+                return
+
+            for e in edges:
+                self._due[e] = True
+                self._schedule(plan.edge_src[e])
+            self._step()
+
+    @staticmethod
+    def _run_batches(node, data, waiting=None):
+        """
+        :param waiting: Number of items that were waiting for the node when data was taken. Defaults to len(data)
+        """
+        adaptive = node.adaptive
+        stats = node._stats
+        # A node that closes itself during the call, such as Take, is given none of the batches after that
+        running = node._state == STATE_RUNNING
+        if adaptive is None and stats is None:
+            for d in _batches(node, data):
+                node._run(d)
+                if running and node._state != STATE_RUNNING:
+                    break
+            return
+
+        if adaptive is not None:
+            # Copies of a node share its AdaptiveBatch, so take the size it last chose
+            node.batch_size = adaptive.size
+
+        size = len(data) if node._runs_lists else node.batch_size
+        left = len(data)
+        if waiting is None:
+            waiting = left
+
+        origins = getattr(data, "origins", None)
+        for d in _batches(node, data):
+            n = min(size, left)
+            left -= n
+
+            emitted = len(node._output_buffer)
+            start = time.perf_counter()
+            node._run(d)
+            elapsed = time.perf_counter() - start
+
+            if adaptive is not None:
+                adaptive.update(n, elapsed, waiting)
+            if stats is not None:
+                stats.record(n, len(node._output_buffer) - emitted, elapsed)
+            if origins is not None:
+                _trace_call(node, data, len(data) - left - n, len(data) - left, elapsed, emitted)
+            if running and node._state != STATE_RUNNING:
+                break
+
+        if adaptive is not None:
+            node.batch_size = adaptive.size
+
     def _run_root(self):
+        if not self.can_pull():
+            return
+
         root = self.graph._root
 
         root.state_transition()
 
-        root._run(None)
-
-        for parcel in root._output_buffer:
-            for successor in self.graph._graph[root]:
-                self.send(root, successor, parcel)
+        _call_root(root)
 
         if len(root._output_buffer) > 0:
-            self.progress_current += 1
-
-        if len(self.graph._graph[root]) == 0:
-            self.print_buffer(root._output_buffer)
-        root._output_buffer.clear()
-
+            self.progress_current += len(root._output_buffer)
+            self._forward(0, root._output_buffer)
+            root._output_buffer.clear()
 
     def _step(self):
         self.total_done += 1
-        for node in self.graph:
+
+        plan = self.plan
+        nodes = plan.nodes
+        ready = self._ready
+        scheduled = self._scheduled
+        flushed = self._flushed
+
+        if nodes[0]._state != STATE_RUNNING and not flushed[0]:
+            self._schedule(0)
+
+        if self._timed_edges:
+            self._check_deadlines()
+
+        deferred = self._deferred
+        self._deferred = []
+        for i in deferred:
+            self._schedule(i)
+
+        while ready:
+            i = heappop(ready)
+            scheduled[i] = False
+
+            node = nodes[i]
             node.state_transition()
-            successors = self.graph._graph[node]
+            running = node._state == STATE_RUNNING
+            blocked = False
+
+            for e in plan.out_edges[i]:
+                j = plan.edge_dst[e]
+                successor = nodes[j]
 
-            for successor in successors:
-                data = self.get_data_to_push(node, successor)
+                # Leave the data, and any close, queued until the successor's outputs have somewhere to go
+                if self._limited and self._is_blocked(j):
+                    blocked = True
+                    continue
 
+                data = self.get_data_to_push(e, node, successor)
                 if data:
-                    data = _filter_data_stream(node, successor, data)
-
-                    if successor.batch_size == 1:
-                        for d in data:
-                            successor._run(d)
-                    elif successor.batch_size == float("inf"):
-                        successor._run(data)
-                    else:
-                        it = iter(data)
-                        while True:
-                            d = tuple(islice(it, successor.batch_size))
-                            if not d:
-                                break
-                            successor._run(d)
-
-                for d in successor._output_buffer:
-                    super_successors = self.graph._graph[successor]
-                    for ss in super_successors:
-                        self.send(successor, ss, d)
-
-                    if len(super_successors) == 0:
-                        self.print_buffer(successor._output_buffer)
-                    successor._output_buffer.clear()
+                    self._run_batches(successor, data)
 
+                if successor._output_buffer:
+                    self._forward(j, successor._output_buffer)
+                    successor._output_buffer.clear()
 
-                if node._state != node.STATE_RUNNING:
+                if not running and successor._state == STATE_RUNNING:
                     successor.close()
 
+                if successor._state != STATE_RUNNING and not flushed[j]:
+                    self._schedule(j)
+
+            if blocked:
+                self._deferred.append(i)
+            elif node._state == STATE_CLOSED:
+                flushed[i] = True
+
+
+def _trace_call(node, data, lo, hi, elapsed, emitted):
+    # Items wait until the call that runs them starts, which for items popped along with others includes the calls
+    # before theirs
+    stats = node._stats
+    now = time.monotonic()
+    started = now - elapsed
+
+    for k in range(lo, hi):
+        stats.waits.add(started - data.queued[k])
+        stats.latency.add(now - data.origins[k])
+
+    if hi > lo:
+        _stamp(node, emitted, min(data.origins[lo:hi]))
+
+
+def _batches(node, data):
+    if node.columnar:
+        batches = [data] if node.batch_size == float("inf") else _split_batches(data, node.batch_size)
+        return (_columns(node, d) for d in batches)
+    elif node.batch_size == 1 and node.adaptive is None:
+        # Adaptive nodes are given tuples even at size 1, so their input keeps one shape as the size changes
+        return [data] if node._runs_lists else data
+    elif node.batch_size == float("inf"):
+        return [data]
+    else:
+        return _split_batches(data, node.batch_size)
+
+
+def _columns(node, batch):
+    if isinstance(node.in_streams, list) and len(node.in_streams) > 1:
+        return tuple(numpy.asarray(column) for column in zip(*batch))
+
+    return numpy.asarray(batch)
+
+
+def _split_batches(data, batch_size):
+    it = iter(data)
+    while True:
+        d = tuple(islice(it, batch_size))
+        if not d:
+            break
+        yield d
+
+
+def _run_replica(node, data, waiting=None):
+    Executor._run_batches(node, data, waiting)
+
+    outputs = node._output_buffer
+    node._output_buffer = []
+    return outputs
+
+
+async def _run_replica_async(node, data):
+    stats = node._stats
+    size = len(data) if node._runs_lists else node.batch_size
+    left = len(data)
+    origins = getattr(data, "origins", None)
+    running = node._state == STATE_RUNNING
+
+    for d in _batches(node, data):
+        emitted = len(node._output_buffer)
+        start = time.perf_counter()
+
+        result = node._run(d)
+        if result is not None:
+            await result
+
+        if stats is not None:
+            n = min(size, left)
+            left -= n
+            elapsed = time.perf_counter() - start
+            stats.record(n, len(node._output_buffer) - emitted, elapsed)
+            if origins is not None:
+                _trace_call(node, data, len(data) - left - n, len(data) - left, elapsed, emitted)
+        if running and node._state != STATE_RUNNING:
+            break
+
+    outputs = node._output_buffer
+    node._output_buffer = []
+    return outputs
+
+
+class ThreadExecutor(Executor):
+    """
+    Runs nodes on a thread pool with the queues shared in memory, so nothing is pickled. Suited to nodes that wait on
+    I/O or release the GIL. The root is run by the calling thread and every other node runs as a task on the pool.
+
+    A node never has more calls in flight than its concurrency. Each concurrent call is made on its own shallow copy
+    of the node, so with the default concurrency of 1 a node's state is only ever used by one thread at a time.
+    """
+    def __init__(self, graph, n_threads, quiet=False, edge_capacity=1024, idle_wait=0.05, ordered=False, **kwargs):
+        """
+        :param edge_capacity: Maximum number of items queued on one edge. See Executor for the other limits
+        :type edge_capacity: int
+        :param idle_wait: Longest the root is left idle when it produces nothing. Idle waits start short and back off
+        :type idle_wait: float
+        """
+        if ordered:
+            raise Exception("%s cannot keep outputs in order. Use ParallelExecutor2 with ordered=True"
+                            % type(self).__name__)
+
+        super().__init__(graph, quiet, edge_capacity=edge_capacity, **kwargs)
+        self.n_threads = n_threads
+        self.idle_wait = idle_wait
+
+        nodes = self.plan.nodes
+        self._replicas = [[node] for node in nodes]
+        for i in range(1, len(nodes)):
+            node = nodes[i]
+            if node.batch_size != float("inf"):
+                for r in range(node.concurrency - 1):
+                    replica = copy.copy(node)
+                    replica._output_buffer = []
+                    if self.collect_stats:
+                        replica._stats = NodeStats(self.trace)
+                    self._replicas[i].append(replica)
+
+        # Replicas of every node that are not running a call
+        self._idle = [list(replicas) for replicas in self._replicas]
+        self._busy = [0] * len(nodes)
+        self._done = [False] * len(nodes)
+        # Nodes that closed themselves, such as Take once it has taken n items. Their input is dropped from then on
+        self._stopped = [False] * len(nodes)
+
+    def _local_nodes(self):
+        return [replica for replicas in self._replicas for replica in replicas]
+
+    def _node_stats(self):
+        if not self.collect_stats:
+            return {}
+        result = {}
+        for replicas in self._replicas:
+            stats = NodeStats()
+            for replica in replicas:
+                stats.merge(replica._stats)
+            result[replicas[0].name] = stats
+        return result
+
+    def _schedule(self, i):
+        # Nodes are started by _launch whenever a replica is free, so there is no ready set to maintain
+        pass
+
+    def can_pull(self):
+        if not self._limited:
+            return True
+
+        if self.max_buffered is not None and self._buffered >= self.max_buffered:
+            return False
+
+        if self.memory_budget is not None and self._buffered_bytes >= self.memory_budget:
+            return False
+
+        return not self._is_blocked(0)
+
+    def _launch(self, pool, in_flight):
+        plan = self.plan
+        launched = False
+
+        for j in range(1, plan.n_nodes):
+            e = plan.in_edge[j]
+            node = plan.nodes[j]
+            queue = self.queues[e]
+            idle = self._idle[j]
+            closed = self._done[plan.edge_src[e]]
+
+            if self._stopped[j]:
+                if queue:
+                    self._pop_batch(e, node, True)
+                continue
+
+            while queue and idle and not self._is_blocked(j):
+                # Once the predecessor is done, only what is left short of a batch is flushed, so the rest of the
+                # queue is still spread over the idle replicas
+                data = self._pop_batch(e, node, closed and len(queue) < node.batch_size)
+                if not data:
+                    break
+
+                replica = idle.pop()
+                self._busy[j] += 1
+                in_flight[self._submit(pool, j, replica, data, len(data) + len(queue))] = (j, replica)
+                launched = True
+
+        return launched
+
+    def _submit(self, pool, j, replica, data, waiting):
+        return pool.submit(self._call, _run_replica, replica, data, waiting)
+
+    def _close_finished(self):
+        plan = self.plan
+        for j in range(1, plan.n_nodes):
+            if self._done[j]:
+                continue
+
+            e = plan.in_edge[j]
+            if self._busy[j] == 0 and (self._stopped[j] or self._done[plan.edge_src[e]] and not self.queues[e]):
+                for replica in self._replicas[j]:
+                    replica.close()
+                    replica.state_transition()
+                self._done[j] = True
+
+    def _complete(self, done, in_flight):
+        for future in done:
+            j, replica = in_flight.pop(future)
+            outputs = future.result()
+
+            self._busy[j] -= 1
+            self._idle[j].append(replica)
+            if replica._state != STATE_RUNNING:
+                self._stopped[j] = True
+
+            if replica.adaptive is not None:
+                # Batches are taken for the node as a whole, so use the size its replicas last chose
+                self.plan.nodes[j].batch_size = replica.adaptive.size
+
+            if outputs:
+                self._forward(j, outputs)
+
+    def _wait_timeout(self, idle):
+        # Longest wait for a node to finish before the root is polled again or a partial batch is due. None means
+        # only a finishing node can change anything
+        timeout = None
+        if not self._done[0] and self.can_pull():
+            timeout = min(self.idle_wait, 0.001 * 2 ** idle) if idle > 0 else 0
+
+        deadline = self.next_deadline()
+        if deadline is not None:
+            timeout = deadline if timeout is None else min(timeout, deadline)
+
+        return timeout
+
+    def _run_root(self):
+        root = self.graph._root
+        if root._state == STATE_CLOSED or not self.can_pull():
+            return False
+
+        root.state_transition()
+        _call_root(root)
+
+        if root._state == STATE_CLOSED:
+            self._done[0] = True
+
+        if len(root._output_buffer) > 0:
+            self.progress_current += len(root._output_buffer)
+            self._forward(0, root._output_buffer)
+            root._output_buffer.clear()
+            return True
+
+        return False
+
+    def _step(self):
+        raise Exception("ThreadExecutor does not use _step. It should not be called")
+
+    def is_finished(self):
+        return all(self._done)
+
+    def _iter_run(self):
+        in_flight = {}
+        idle = 0
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            while not self.is_finished():
+                emitted = self._run_root()
+                if self._timed_edges:
+                    self._check_deadlines()
+                launched = self._launch(pool, in_flight)
+                self._close_finished()
+
+                if emitted or launched:
+                    idle = 0
+                elif in_flight or not self._done[0]:
+                    # Wake as soon as a node finishes. While the root is still open it has to be polled again, so
+                    # only wait for a short, growing interval
+                    timeout = self._wait_timeout(idle)
+                    if not self._done[0] and self.can_pull():
+                        idle += 1
+
+                    if in_flight:
+                        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                        self._complete(done, in_flight)
+                    elif timeout:
+                        time.sleep(timeout)
+
+                self.update_progress()
+                yield from self.take_results()
+
+    def run(self, update_callback=None):
+        self._init_update(update_callback)
+
+        for _ in self._iter_run():
+            pass
+
+    def iter_results(self, update_callback=None):
+        self.collect = True
+        self._init_update(update_callback)
+
+        yield from self._iter_run()
+
+
+class AsyncExecutor(ThreadExecutor):
+    """
+    Runs the graph on an asyncio event loop. Nodes may define run as a coroutine (async def run), in which case up to
+    concurrency calls of the node are awaited at the same time. Other nodes run on a thread pool of n_threads threads,
+    as in ThreadExecutor.
+    """
+    def __init__(self, graph, n_threads=1, quiet=False, **kwargs):
+        super().__init__(graph, n_threads, quiet, **kwargs)
+
+        self._is_async = [inspect.iscoroutinefunction(node.run) for node in self.plan.nodes]
+
+        self._loop = None
+        self._completed = []
+        self._wakeup = None
+
+    def _submit(self, pool, j, replica, data, waiting):
+        if self._is_async[j]:
+            future = self._loop.create_task(_run_replica_async(replica, data))
+        else:
+            future = self._loop.run_in_executor(pool, self._call, _run_replica, replica, data, waiting)
+
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        self._completed.append(future)
+        self._wakeup.set()
+
+    async def _run_root_async(self):
+        root = self.graph._root
+        if root._state == STATE_CLOSED or not self.can_pull():
+            return False
+
+        root.state_transition()
+        emitted = len(root._output_buffer)
+        start = time.perf_counter()
+
+        result = root._run(None)
+        if result is not None:
+            await result
+
+        if root._stats is not None:
+            root._stats.record(0, len(root._output_buffer) - emitted, time.perf_counter() - start)
+            if self.trace:
+                _stamp(root, emitted, time.monotonic())
+
+        if root._state == STATE_CLOSED:
+            self._done[0] = True
+
+        if len(root._output_buffer) > 0:
+            self.progress_current += len(root._output_buffer)
+            self._forward(0, root._output_buffer)
+            root._output_buffer.clear()
+            return True
+
+        return False
+
+    async def _advance(self, pool, in_flight):
+        # Runs until there are results to hand to the consumer or the graph is finished. Completions are reported by
+        # callbacks rather than asyncio.wait, which would cost O(in flight) for every completed call
+        idle = 0
+        while not self.is_finished() and not self._results:
+            emitted = await self._run_root_async()
+            if self._timed_edges:
+                self._check_deadlines()
+            launched = self._launch(pool, in_flight)
+            self._close_finished()
+
+            if not (emitted or launched) and (in_flight or not self._done[0]):
+                timeout = self._wait_timeout(idle)
+                if not self._done[0] and self.can_pull():
+                    idle += 1
+
+                if not self._completed:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            else:
+                idle = 0
+                # Let tasks that were just started make progress before the root is polled again
+                await asyncio.sleep(0)
+
+            completed = self._completed
+            self._completed = []
+            self._complete(completed, in_flight)
+
+            self.update_progress()
+
+    def _iter_run(self):
+        in_flight = {}
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = asyncio.Event()
+        pool = ThreadPoolExecutor(max_workers=self.n_threads)
+
+        try:
+            while not self.is_finished():
+                self._loop.run_until_complete(self._advance(pool, in_flight))
+                yield from self.take_results()
+        finally:
+            tasks = [f for f in in_flight if not f.done()]
+            for f in tasks:
+                f.cancel()
+            if tasks:
+                self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+            pool.shutdown()
+            self._loop.close()
+
 
 class ParallelExecutor(BaseExecutor):
-    def __init__(self, graph, n_threads, quiet=False):
-        super().__init__(graph, quiet)
+    def __init__(self, graph, n_threads, quiet=False, result_buffer=64, max_in_flight=None, shared_memory=False,
+                 shared_memory_min_bytes=2 ** 16, serializer=None, stats=False, trace=False, ordered=False):
+        """
+        :param result_buffer: The number of submitted steps that may be outstanding before the root stops being run
+        :type result_buffer: int
+        :param max_in_flight: If given, the root also stops being run while more than this many of its outputs have
+        been submitted without being processed
+        :type max_in_flight: int
+        :param shared_memory: If True, root outputs that are NumPy arrays, bytes or memoryviews are sent to workers
+        through shared memory instead of being pickled. See SharedMemoryTransport
+        :type shared_memory: bool
+        :param shared_memory_min_bytes: Buffers smaller than this are pickled even when shared_memory is True
+        :type shared_memory_min_bytes: int
+        :param serializer: How items are encoded on their way to and from workers. One of "tuple", "pickle5" or "zlib",
+        or a Serializer. By default parcels are pickled as they are
+        :type serializer: str or Serializer
+        :param ordered: If True, outputs of sink nodes are printed or yielded in the order of the root outputs they
+        came from. Every step hands each worker a contiguous slice of the root outputs and steps are taken in the
+        order they were submitted, so result_buffer bounds how far results are held back. Partial batches are run at
+        the end of every step. Nodes with batch_size Node.BATCH_SIZE_ALL cannot be used
+        :type ordered: bool
+        """
+        if ordered:
+            _check_ordered(graph)
+
+        super().__init__(graph, quiet, stats, trace)
 
         self.n_threads = n_threads
         self.manager = Manager()
@@ -189,9 +1215,22 @@ class ParallelExecutor(BaseExecutor):
         self.done_counter = self.manager.Value(ctypes.c_int, 0, lock=False)
         self.counter_lock = self.manager.Lock()
 
-        self.executor = SingleExecRunner(Executor(graph, quiet))
+        self.executor = SingleExecRunner(Executor(graph, quiet, stats=stats, trace=trace),
+                                         serializer=get_serializer(serializer))
+
+        # Results are printed by the parent when they have to be in order
+        self.ordered = ordered
+        self.executor.ordered = ordered
+        self.executor.executor.collect = ordered
+
+        self.result_buffer = result_buffer
+        self.max_in_flight = max_in_flight
+        self.shared_memory = shared_memory
+        self.shared_memory_min_bytes = shared_memory_min_bytes
 
         self._last_res = None
+        self._pending = deque()
+        self._in_flight = 0
 
         self.root_closed = False
 
@@ -202,21 +1241,28 @@ class ParallelExecutor(BaseExecutor):
 
         if root._state == root.STATE_RUNNING:
             for i in range(self.n_threads):
-                root._run(None)
+                _call_root(root)
         elif root._state == root.STATE_CLOSED:
             self.root_closed = True
         else:
             root.state_transition()
 
-        for parcel in root._output_buffer:
-            self.queues[self._curr_thread].append(parcel)
-
-            self._curr_thread += 1
-            if self._curr_thread == self.n_threads:
-                self._curr_thread = 0
-
         if len(self.graph._graph[root]) == 0:
-            self.print_buffer(root._output_buffer)
+            # Workers would sink the outputs again, so they are given nothing
+            self._sink(root, root._output_buffer)
+            self.counter_lock.acquire()
+            self.done_counter.value += len(root._output_buffer)
+            self.counter_lock.release()
+        elif self.ordered:
+            # Split into slices when the step is submitted
+            self.queues[0].extend(root._output_buffer)
+        else:
+            for parcel in root._output_buffer:
+                self.queues[self._curr_thread].append(parcel)
+
+                self._curr_thread += 1
+                if self._curr_thread == self.n_threads:
+                    self._curr_thread = 0
 
         root._output_buffer.clear()
 
@@ -226,34 +1272,139 @@ class ParallelExecutor(BaseExecutor):
 
         return self.root_closed and self.pool._taskqueue.empty()
 
+    def _slices(self):
+        # Results of a step come back in the order of its arguments, so in order each worker gets the next slice
+        q = self.queues[0]
+        size = -(-len(q) // self.n_threads)
+        slices = [q[k:k + size] for k in range(0, len(q), size)] if q else []
+        q.clear()
+        return slices
+
     def _step(self):
         root = self.graph._root
 
+        if self.ordered:
+            slices = self._slices()
+        else:
+            slices = []
+            for q in self.queues:
+                slices.append(list(q))
+                q.clear()
+
         args = []
-        for i in range(self.n_threads):
-            q = self.queues[i]
+        n_items = 0
+        for parcels in slices:
+            n_items += len(parcels)
 
-            if len(q) > 0:
+            if len(parcels) > 0:
                 arg = root._state, self.done_counter, self.counter_lock, []
-                while len(q) > 0:
-                    parcel = q.pop()
+                for parcel in parcels:
+                    if self.executor.transport is not None:
+                        parcel.data = self.executor.transport.pack(parcel.data)
                     arg[-1].append(parcel)
 
+                if self.executor.serializer is not None:
+                    arg = arg[:-1] + (_encode_parcels(self.executor.serializer, arg[-1], self.trace),)
+
                 args.append(arg)
 
         self._last_res = self.pool.starmap_async(self.executor.step, args, error_callback=error_func)
+        self._pending.append((self._last_res, n_items))
+        self._in_flight += n_items
+
+        if not self.collect:
+            self._print_results(self._take_pending(self.result_buffer))
 
         self.progress_current = self.done_counter.value
         self.update_progress()
 
+    def _take_pending(self, limit):
+        while self._pending:
+            res, n_items = self._pending[0]
 
-    def run(self, update_callback=None):
+            over = len(self._pending) > limit
+            if self.max_in_flight is not None and self._in_flight > self.max_in_flight:
+                over = True
+
+            if not over and not res.ready():
+                break
+
+            self._pending.popleft()
+            self._in_flight -= n_items
+            for results, report in res.get():
+                for i, state in report["adaptive"].items():
+                    node = self.executor.executor.plan.nodes[i]
+                    node.adaptive = state
+                    node.batch_size = state.size
+
+                for i, step_stats in report["stats"].items():
+                    self.executor.executor.plan.nodes[i]._stats.merge(step_stats)
+
+                if "profile" in report:
+                    self._profiles.append(report["profile"])
+
+                if self.executor.serializer is not None:
+                    results = self.executor.serializer.loads(results)
+                yield from results
+
+    def _print_results(self, results):
+        # Workers print their own results unless they have to be in order
+        for name, data in results:
+            if not self.quiet:
+                print(data)
+
+    def _start_pool(self):
+        if self.shared_memory:
+            # Tasks are pickled, so segments are returned through the manager instead of a queue workers inherit
+            self.executor.transport = SharedMemoryTransport(self.manager.Queue(), self.shared_memory_min_bytes)
+
+        self.executor.profiler = self.profiler
         self.pool = Pool(processes=self.n_threads)
 
-        super().run(update_callback)
+    def _close_transport(self):
+        if self.executor.transport is not None:
+            self.executor.transport.close()
+            self.executor.transport = None
 
-        self.pool.close()
-        self.pool.join()
+    def run(self, update_callback=None):
+        self._start_pool()
+
+        try:
+            super().run(update_callback)
+
+            self.pool.close()
+            self.pool.join()
+
+            # Steps still pending carry what their workers recorded
+            self._print_results(self._take_pending(0))
+        finally:
+            self._close_transport()
+
+        self.progress_current = self.done_counter.value
+        self.update_progress()
+
+    def iter_results(self, update_callback=None):
+        self.collect = True
+        self.executor.executor.collect = True
+        self._start_pool()
+
+        try:
+            self._init_update(update_callback)
+
+            while not self.is_finished():
+                self._run_root()
+                yield from self.take_results()
+
+                self._step()
+                yield from self._take_pending(self.result_buffer)
+
+            yield from self._take_pending(0)
+
+            self.pool.close()
+            self.pool.join()
+        finally:
+            self.pool.terminate()
+            self._close_transport()
 
         self.progress_current = self.done_counter.value
         self.update_progress()
@@ -261,18 +1412,46 @@ class ParallelExecutor(BaseExecutor):
 
 
 class SingleExecRunner(object):
-    def __init__(self, executor):
+    def __init__(self, executor, transport=None, serializer=None):
         self.executor = executor
         self.root = executor.graph._root
+        self.transport = transport
+        self.serializer = serializer
+        self.profiler = None
+        self.ordered = False
 
     def step(self, root_state, done_counter, counter_lock, parcels):
+        nodes = self.executor.plan.nodes
+        if self.executor.collect_stats:
+            # The parent's copy holds what earlier steps recorded, so record this step from zero
+            for node in nodes:
+                node._stats = NodeStats(self.executor.trace)
+
+        profiler = _start_profile(self.profiler, nodes)
+
+        if self.serializer is not None:
+            parcels = _decode_parcels(self.serializer, parcels, self.executor.trace)
+
         if parcels:
-            for parcel in parcels:
-                for successor in self.executor.graph._graph[self.root]:
-                    self.executor.send(self.root, successor, parcel)
+            if self.transport is not None:
+                for parcel in parcels:
+                    parcel.data = self.transport.unpack(parcel.data)
+
+            self.executor.push_root(parcels)
 
         self.executor._step()
 
+        if self.ordered:
+            # Outputs of this step must not be left for a later one
+            self.executor._flush()
+        elif self.executor._timed_edges:
+            # Every step runs on a fresh copy of the graph, so a partial batch left now would be lost
+            self.executor._check_deadlines(force=True)
+            self.executor._step()
+
+        if self.transport is not None:
+            self.transport.flush()
+
         if parcels:
             counter_lock.acquire()
             done_counter.value += len(parcels)
@@ -281,6 +1460,15 @@ class SingleExecRunner(object):
         if root_state == STATE_CLOSING:
             self.executor.graph._root._state = STATE_CLOSING
 
+        # Every step starts from the parent's copy of the graph, so send back what adaptive nodes learned
+        report = {"adaptive": {i: node.adaptive for i, node in enumerate(nodes) if node.adaptive is not None},
+                  "stats": {i: node._stats for i, node in enumerate(nodes) if node._stats is not None}}
+        _stop_profile(profiler, report)
+
+        if self.serializer is not None:
+            return self.serializer.dumps(self.executor.take_results()), report
+        return self.executor.take_results(), report
+
     def is_finished(self):
         return self.executor.is_finished()
 
@@ -290,35 +1478,210 @@ def error_func(value):
 
 
 
-def _child_run(queue: multiprocessing.Queue, graph, done_count, quiet):
-    executor = Executor(graph, quiet=quiet)
+def _child_run(queue: multiprocessing.Queue, graph, done_count, quiet, results=None, credits=None, transport=None,
+               serializer=None, drain_on_error=False, reports=None, stats=False, trace=False, profiler=None,
+               ordered=False):
+    executor = Executor(graph, quiet=quiet, stats=stats, trace=trace)
+    executor.collect = results is not None
     root = graph._root
+    profiler = _start_profile(profiler, executor._local_nodes())
+
+    try:
+        while not executor.is_finished():
+            chunk = None
+            seq = None
+
+            # Blocking here is safe: a step drains everything that is ready, so until more input, the close signal or
+            # a partial batch's deadline arrives there is nothing to do. Once the root is closing, keep stepping to
+            # propagate the close.
+            if root._state == STATE_RUNNING:
+                try:
+                    chunk = queue.get(timeout=executor.next_deadline())
+                except Empty:
+                    pass
+
+                if chunk == _CLOSE_SIGNAL:
+                    root.close()
+                    chunk = None
+                else:
+                    if chunk is not None and ordered:
+                        seq, chunk = chunk
+                    if chunk is not None and serializer is not None:
+                        chunk = _decode_parcels(serializer, chunk, trace)
 
-    while not executor.is_finished():
-        if not queue.empty():
-            parcel = queue.get()
-            if parcel == "close":
-                root.close()
-                continue
-        else:
-            parcel = None
-
-        root.state_transition()
-
-        if parcel:
-            for successor in graph._graph[root]:
-                executor.send(root, successor, parcel)
-            with done_count.get_lock():
-                done_count.value += 1
+            root.state_transition()
 
-        executor._step()
+            if chunk:
+                if transport is not None:
+                    for parcel in chunk:
+                        parcel.data = transport.unpack(parcel.data)
+
+                executor.push_root(chunk)
+                with done_count.get_lock():
+                    done_count.value += len(chunk)
+
+            executor._step()
+
+            if seq is not None:
+                # Every chunk is run all the way through, so its results are complete and can be put back in order
+                executor._flush()
+
+            if chunk and credits is not None:
+                credits.release()
+
+            if transport is not None:
+                transport.flush()
+
+            if seq is not None:
+                batch = executor.take_results()
+                results.put((_CHUNK_SIGNAL, seq, serializer.dumps(batch) if serializer is not None else batch))
+            elif executor.collect and executor._results:
+                batch = executor.take_results()
+                results.put(serializer.dumps(batch) if serializer is not None else batch)
+    except Exception:
+        # A worker that is reused must take its close signal off the queue before it reports the run as done, or the
+        # worker that reads it would take it as the close of the next run
+        if drain_on_error and root._state == STATE_RUNNING:
+            while queue.get() != _CLOSE_SIGNAL:
+                pass
+        raise
+    finally:
+        if transport is not None:
+            # The parent may have stopped reading freed segments, so do not wait to flush them at exit
+            transport.free_queue.cancel_join_thread()
+
+        report = executor.report()
+        _stop_profile(profiler, report)
+        if reports is not None:
+            reports.put((_REPORT_SIGNAL, report))
+
+        if results is not None:
+            results.put(_CLOSE_SIGNAL)
+
+
+def _shard_run(graph, shard, done_count, quiet, results=None, serializer=None, reports=None, stats=False,
+               trace=False, profiler=None):
+    # Run the whole graph here, with this worker's shard in place of the root
+    successors = graph._graph.pop(graph._root)
+    graph._node_list.discard(graph._root)
+    if graph._last_added is graph._root:
+        graph._last_added = shard
+
+    graph._root = shard
+    graph._graph[shard] = successors
+    graph._node_list.add(shard)
+
+    executor = Executor(graph, quiet=quiet, stats=stats, trace=trace)
+    executor.collect = results is not None
+    profiler = _start_profile(profiler, executor._local_nodes())
+
+    try:
+        while not executor.is_finished():
+            executor._run_root()
+            executor._step()
+
+            done_count.value = executor.progress_current
+
+            if executor.collect and executor._results:
+                batch = executor.take_results()
+                results.put(serializer.dumps(batch) if serializer is not None else batch)
+    finally:
+        report = executor.report()
+        _stop_profile(profiler, report)
+        if reports is not None:
+            reports.put((_REPORT_SIGNAL, report))
+
+        if results is not None:
+            results.put(_CLOSE_SIGNAL)
 
 
 class ParallelExecutor2(BaseExecutor):
     MAX_QUEUE_SIZE = 100
-    def __init__(self, graph, n_threads, quiet=False):
-        super().__init__(graph, quiet)
+    def __init__(self, graph, n_threads, quiet=False, chunk_size=1, chunk_bytes=None, chunk_latency=0.05,
+                 idle_wait=0.05, update_interval=0.5, result_buffer=64, max_in_flight=None, shared_memory=False,
+                 shared_memory_min_bytes=2 ** 16, serializer=None, pool=None, shard=False, stats=False, trace=False,
+                 ordered=False, reorder_window=64):
+        """
+        :param chunk_size: Maximum number of root outputs shipped to a worker in one queue put
+        :type chunk_size: int
+        :param chunk_bytes: If given, a chunk is also shipped once its approximate payload reaches this many bytes
+        :type chunk_bytes: int
+        :param chunk_latency: Seconds a partially filled chunk may wait for more root outputs before it is shipped
+        :type chunk_latency: float
+        :param idle_wait: Longest the root is left idle when it produces nothing. Idle waits start short and back off
+        :type idle_wait: float
+        :param update_interval: Seconds between progress updates while waiting for workers to finish
+        :type update_interval: float
+        :param result_buffer: When collecting results, the number of result batches workers may queue up before they
+        wait for the consumer
+        :type result_buffer: int
+        :param max_in_flight: If given, the root waits once this many of its outputs, rounded up to whole chunks, have
+        been sent to workers without being processed
+        :type max_in_flight: int
+        :param shared_memory: If True, root outputs that are NumPy arrays, bytes or memoryviews are sent to workers
+        through shared memory instead of being pickled. See SharedMemoryTransport
+        :type shared_memory: bool
+        :param shared_memory_min_bytes: Buffers smaller than this are pickled even when shared_memory is True
+        :type shared_memory_min_bytes: int
+        :param serializer: How chunks and results are encoded on their way to and from workers. One of "tuple",
+        "pickle5" or "zlib", or a Serializer. By default parcels are pickled as they are
+        :type serializer: str or Serializer
+        :param pool: If given, the graph is run by the workers of this pool instead of processes started for the run.
+        n_threads and result_buffer are then those of the pool
+        :type pool: WorkerPool
+        :param shard: If True, the root is split with its shard method and every worker runs the whole graph on its
+        own shard, so no items are sent from the parent. See Source.shard
+        :type shard: bool
+        :param ordered: If True, outputs of sink nodes are printed or yielded in the order of the root outputs they
+        came from. Every chunk is numbered as it is shipped and run all the way through by the worker that takes it,
+        so batches do not span chunks, and the parent puts the results of chunks back in order before handing them on.
+        chunk_size must be at least the batch_size of every node, and nodes with batch_size Node.BATCH_SIZE_ALL cannot
+        be used. Chunks shipped early because of chunk_bytes or chunk_latency may still end in a partial batch
+        :type ordered: bool
+        :param reorder_window: When ordered, the most chunks that may be shipped but not yet handed on. The root waits
+        while this many are outstanding, which bounds the results held back waiting for an earlier chunk
+        :type reorder_window: int
+        """
+        super().__init__(graph, quiet, stats, trace)
         self.n_threads = n_threads
+        self.pool = pool
+        self.shard = shard
+
+        if pool is not None and shard:
+            raise Exception("shard cannot be used with a WorkerPool")
+        if ordered and shard:
+            raise Exception("ordered cannot be used with shard")
+        if ordered:
+            _check_ordered(graph, chunk_size)
+        if reorder_window < 1:
+            raise Exception("reorder_window must be >= 1. Got %s" % reorder_window)
+        if pool is not None:
+            self.n_threads = pool.n_threads
+            if max_in_flight is not None or shared_memory:
+                raise Exception("max_in_flight and shared_memory cannot be used with a WorkerPool")
+
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.chunk_latency = chunk_latency
+
+        self.idle_wait = idle_wait
+        self.update_interval = update_interval
+        self.result_buffer = result_buffer
+        self.max_in_flight = max_in_flight
+        self.shared_memory = shared_memory
+        self.shared_memory_min_bytes = shared_memory_min_bytes
+        self.serializer = get_serializer(serializer)
+
+        self._stop = threading.Event()
+        self._credits = None
+        self._transport = None
+        self._close_sent = False
+        self._report_queue = None
+
+        self.ordered = ordered
+        self.reorder_window = reorder_window
+        self._window = None
+        self._seq = 0
 
     def _run_root(self):
         raise Exception("ParallelExecutor2 does not use _run_root or _step. These should not be called")
@@ -333,59 +1696,647 @@ class ParallelExecutor2(BaseExecutor):
         self.progress_current = total_done
         self.update_progress()
 
-    def run(self, update_callback=None):
-        self._init_update(update_callback)
+    def _worker_options(self):
+        return {"stats": self.collect_stats, "trace": self.trace, "profiler": self.profiler}
 
-        root = self.graph._root
+    def _start_children(self, results=None):
+        self._reports = []
+        if self.pool is not None:
+            # Workers of a pool send their report on the result queue, ahead of their close signal
+            return self.pool._start_job(self.graph, results is not None, self.quiet, self.serializer,
+                                        self._wants_reports(), ordered=self.ordered, **self._worker_options())
+
+        self._report_queue = multiprocessing.Queue() if self._wants_reports() else None
+        if self.shard:
+            return self._start_shards(results)
+
+        if self.max_in_flight is not None:
+            self._credits = multiprocessing.Semaphore(max(1, -(-self.max_in_flight // self.chunk_size)))
+
+        if self.shared_memory:
+            self._transport = SharedMemoryTransport(multiprocessing.Queue(), self.shared_memory_min_bytes)
+
+        # All workers take chunks from one queue, so whichever worker is free next gets the next chunk and a run of
+        # slow items cannot back up behind a single worker
+        q = multiprocessing.Queue(ParallelExecutor2.MAX_QUEUE_SIZE)
 
         children = []
         for i in range(self.n_threads):
-            q = multiprocessing.Queue(ParallelExecutor2.MAX_QUEUE_SIZE)
             count = multiprocessing.Value(ctypes.c_int, 0, lock=True)
-            p = multiprocessing.Process(target=_child_run, args=(q, self.graph, count, self.quiet))
+            p = multiprocessing.Process(target=_child_run, args=(q, self.graph, count, self.quiet, results,
+                                                                 self._credits, self._transport, self.serializer),
+                                        kwargs=dict(reports=self._report_queue, ordered=self.ordered,
+                                                    **self._worker_options()))
             children.append({"process": p, "queue": q, "count": count})
             children[i]["process"].start()
 
-        t = 0
-        while root._state != STATE_CLOSED:
+        return children
+
+    def _start_shards(self, results=None):
+        root = self.graph._root
+        shards = [root.shard(i, self.n_threads) if hasattr(root, "shard") else None for i in range(self.n_threads)]
+        if any(shard is None for shard in shards):
+            raise Exception("%s cannot be sharded" % root)
+
+        children = []
+        for shard in shards:
+            count = multiprocessing.Value(ctypes.c_int, 0, lock=True)
+            p = multiprocessing.Process(target=_shard_run, args=(self.graph, shard, count, self.quiet, results,
+                                                                 self.serializer),
+                                        kwargs=dict(reports=self._report_queue, **self._worker_options()))
+            children.append({"process": p, "queue": None, "count": count})
+            p.start()
+
+        return children
+
+    def _put_chunk(self, children, chunk):
+        window = self._window
+        if window is not None:
+            while not window.acquire(timeout=self.update_interval):
+                if self._stop.is_set():
+                    return
+
+        if self._credits is not None:
+            while not self._credits.acquire(timeout=self.update_interval):
+                if self._stop.is_set():
+                    return
+
+        if self._transport is not None:
+            for parcel in chunk:
+                parcel.data = self._transport.pack(parcel.data)
+
+        if self.serializer is not None:
+            chunk = _encode_parcels(self.serializer, chunk, self.trace)
+
+        if window is not None:
+            chunk = self._seq, chunk
+            self._seq += 1
+
+        q = children[0]["queue"]
+        while not self._stop.is_set():
+            try:
+                q.put(chunk, timeout=self.update_interval)
+                return
+            except queue.Full:
+                if self.pool is None:
+                    self._failed(children)
+
+    def _feed(self, children, report_progress=True):
+        if self.shard:
+            # Every worker runs its own shard of the root
+            return
+
+        root = self.graph._root
+        chunks = _ChunkBuffer(self.chunk_size, self.chunk_bytes, self.chunk_latency)
+        self._close_sent = False
+
+        idle = 0
+        while root._state != STATE_CLOSED and not self._stop.is_set():
             root.state_transition()
-            root._run(None)
+            _call_root(root)
 
             if len(root._output_buffer) > 0:
+                idle = 0
                 for parcel in root._output_buffer:
-                    added = False
-                    while not added:
-                        q = children[t]["queue"]
-
-                        try:
-                            q.put(parcel, timeout=1)
-                            added = True
-                        except queue.Full:
-                            pass
-
-                        t += 1
-                        if t == self.n_threads:
-                            t = 0
-            else:
-                time.sleep(1)
+                    if chunks.add(parcel):
+                        self._put_chunk(children, chunks.take())
+            elif root._state == STATE_RUNNING:
+                # The root is polled, so there is nothing to block on. Back off gradually so a briefly slow source
+                # only costs a few milliseconds
+                if idle > 0:
+                    time.sleep(min(self.idle_wait, 0.001 * 2 ** (idle - 1)))
+                idle += 1
 
-            self.do_update(children)
+            if chunks.expired():
+                self._put_chunk(children, chunks.take())
+
+            if report_progress:
+                self.do_update(children)
 
             root._output_buffer.clear()
 
+        if len(chunks) > 0:
+            self._put_chunk(children, chunks.take())
 
-        for i in range(self.n_threads):
-            children[i]["queue"].put("close")
+        if self._stop.is_set():
+            return
 
-        all_done = False
-        while not all_done:
-            all_done = True
+        self._send_close(children)
 
-            for i in range(self.n_threads):
-                children[i]["process"].join(timeout=1)
-                if children[i]["process"].exitcode is None:
-                    all_done = False
+    def _send_close(self, children):
+        # A worker stops reading after its close signal, so each one gets exactly one
+        for c in children:
+            c["queue"].put(_CLOSE_SIGNAL)
+        self._close_sent = True
+
+    def _failed(self, children):
+        # The chunks a worker took are lost with it, and once every worker is gone nothing reads the queue
+        for c in children:
+            p = c["process"]
+            if p.exitcode is not None and p.exitcode != 0:
+                self._stop.set()
+                return p
+        return None
 
+    def _check_children(self, children):
+        p = self._failed(children)
+        if p is not None:
+            raise Exception("Worker %s exited with code %s" % (p.name, p.exitcode))
+
+    def _end_children(self, children):
+        self._stop.set()
+        for c in children:
+            if c["process"].is_alive():
+                # Nothing will read what is left in the queue, so do not wait to flush it at exit
+                if c["queue"] is not None:
+                    c["queue"].cancel_join_thread()
+                c["process"].terminate()
+
+    def _wait_children(self, children):
+        running = [c["process"].sentinel for c in children]
+        reports = self._report_queue
+
+        # A worker cannot exit before its report has been read off the pipe, so keep reading them while waiting
+        timeout = self.update_interval if self.use_callback or reports is not None else None
+
+        while running:
+            for sentinel in multiprocessing.connection.wait(running, timeout=timeout):
+                running.remove(sentinel)
+            self._check_children(children)
+
+            if reports is not None:
+                self._take_reports(reports, len(children), [], block=False)
             self.do_update(children)
 
+        if reports is not None:
+            self._take_reports(reports, len(children), [c["process"] for c in children])
+
+        for c in children:
+            c["process"].join()
+
+    def _wait_pool(self, children, n_done=0):
+        # Workers of a pool do not exit at the end of a run. Each sends a close signal once it is done instead
+        timeout = self.update_interval if self.use_callback else None
+
+        while n_done < self.n_threads:
+            try:
+                batch = self.pool.results.get(timeout=timeout)
+            except Empty:
+                batch = None
+
+            if batch == _CLOSE_SIGNAL:
+                n_done += 1
+            elif isinstance(batch, tuple) and batch[0] == _REPORT_SIGNAL:
+                self._reports.append(batch[1])
+
+            self.do_update(children)
+
+    def _finish_pool(self, children, n_done):
+        # Even when the run is cut short, the workers have to reach the end of it before the pool is used again
+        if not self._close_sent:
+            self._send_close(children)
+
+        self._wait_pool(children, n_done)
+        self.pool._end_job()
+
+    def _close_transport(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def run(self, update_callback=None):
+        if self.ordered:
+            # Workers cannot print their results in order, so they are sent back and printed here
+            for name, data in self.iter_results(update_callback):
+                if not self.quiet:
+                    print(data)
+            return
+
+        self._stop.clear()
+        self._init_update(update_callback)
+
+        children = self._start_children()
+        try:
+            self._feed(children)
+            if self.pool is None:
+                self._check_children(children)
+                self._wait_children(children)
+        except BaseException:
+            if self.pool is None:
+                self._end_children(children)
+            raise
+        finally:
+            self._close_transport()
+            if self.pool is not None:
+                self._finish_pool(children, 0)
+
+    def iter_results(self, update_callback=None):
+        self.collect = True
+        self._stop.clear()
+        self._init_update(update_callback)
+
+        # Workers block once the result queue is full, so the root is fed from a thread while this generator
+        # hands results to the consumer at whatever pace it reads them
+        results = self.pool.results if self.pool is not None else multiprocessing.Queue(self.result_buffer)
+        if self.ordered:
+            self._window = threading.Semaphore(self.reorder_window)
+            self._seq = 0
+        children = self._start_children(results)
+        feeder = threading.Thread(target=self._call, args=(self._feed, children, False), daemon=True)
+        feeder.start()
+
+        # Results are waited on for at most update_interval, so that a worker that died is noticed
+        timeout = self.update_interval if self.use_callback or self.pool is None else None
+        n_done = 0
+        # Results of chunks that came back ahead of an earlier chunk, by sequence number, and the next one to hand on
+        held = {}
+        next_seq = 0
+        # Results made while workers close, after every chunk they took, are handed on last
+        closing = []
+        try:
+            while n_done < self.n_threads:
+                try:
+                    batch = results.get(timeout=timeout)
+                except Empty:
+                    if self.pool is None:
+                        self._check_children(children)
+                    self.do_update(children)
+                    continue
+
+                if batch == _CLOSE_SIGNAL:
+                    n_done += 1
+                elif isinstance(batch, tuple) and batch[0] == _REPORT_SIGNAL:
+                    self._reports.append(batch[1])
+                elif isinstance(batch, tuple) and batch[0] == _CHUNK_SIGNAL:
+                    held[batch[1]] = batch[2]
+                    while next_seq in held:
+                        batch = held.pop(next_seq)
+                        yield from self.serializer.loads(batch) if self.serializer is not None else batch
+                        next_seq += 1
+                        self._window.release()
+                elif self.ordered:
+                    closing.append(batch)
+                elif self.serializer is not None:
+                    yield from self.serializer.loads(batch)
+                else:
+                    yield from batch
+
+                self.do_update(children)
+
+            for batch in closing:
+                yield from self.serializer.loads(batch) if self.serializer is not None else batch
+
+            feeder.join()
+            if self.pool is None:
+                self._wait_children(children)
+        finally:
+            self._stop.set()
+            if self.pool is not None:
+                feeder.join()
+                self._finish_pool(children, n_done)
+            else:
+                self._end_children(children)
+
+            self._close_transport()
+            self._window = None
+
+
+def _stage_run(plan, j, in_queue, out_queues, closes, n_replicas, quiet, results=None, reports=None, stats=False,
+               profiler=None):
+    node = plan.nodes[j]
+    node._stats = NodeStats() if stats else None
+    profiler = _start_profile(profiler, [node])
+
+    # Every replica of the predecessor sends one close signal after its data. Whichever replica of this node reads the
+    # last of them has seen all of the input, and tells the other replicas to stop
+    expected_closes = n_replicas[plan.edge_src[plan.in_edge[j]]]
+
+    def forward():
+        if not node._output_buffer:
+            return
+
+        if not out_queues:
+            if results is not None:
+                results.put([(node.name, parcel.data) for parcel in node._output_buffer])
+            elif not quiet:
+                for parcel in node._output_buffer:
+                    print(parcel.data)
+        else:
+            values = [parcel.data for parcel in node._output_buffer]
+            for e, q in out_queues:
+                q.put(plan.project(e, values))
+        node._output_buffer.clear()
+
+    timed = _timed(node)
+    arrivals = _Arrivals()
+    closed = False
+
+    try:
+        pending = []
+        while True:
+            timeout = None
+            if timed and pending:
+                timeout = max(0, arrivals.oldest() + node.max_batch_latency - time.monotonic())
+
+            try:
+                chunk = in_queue.get(timeout=timeout)
+            except Empty:
+                chunk = []
+
+            if chunk == _STOP_SIGNAL:
+                break
+
+            if chunk == _CLOSE_SIGNAL:
+                with closes.get_lock():
+                    closes.value += 1
+                    last = closes.value == expected_closes
+
+                if last:
+                    for r in range(n_replicas[j] - 1):
+                        in_queue.put(_STOP_SIGNAL)
+                    break
+                continue
+
+            if closed:
+                # The node closed itself. Its input is still read, so the stages before it are not blocked
+                continue
+
+            pending.extend(chunk)
+            if stats:
+                node._stats.queued(len(pending))
+
+            # Once the oldest pending item has waited max_batch_latency, run whatever is pending
+            due = False
+            if timed:
+                now = time.monotonic()
+                arrivals.add(len(chunk), now)
+                due = bool(pending) and now - arrivals.oldest() >= node.max_batch_latency
+
+            if len(pending) >= node.batch_size or due:
+                if node.batch_size == 1 or due:
+                    data = pending
+                    pending = []
+                else:
+                    n = len(pending) - len(pending) % node.batch_size
+                    data = pending[:n]
+                    pending = pending[n:]
+
+                arrivals.take(len(data))
+                Executor._run_batches(node, data, len(data) + len(pending))
+                forward()
+
+                if node._state != STATE_RUNNING:
+                    closed = True
+                    pending = []
+                    for e, q in out_queues:
+                        q.put(_CLOSE_SIGNAL)
+
+        if pending:
+            Executor._run_batches(node, pending)
+        node.close()
+        node.state_transition()
+        forward()
+    finally:
+        if not closed:
+            for e, q in out_queues:
+                q.put(_CLOSE_SIGNAL)
+
+        sizes = {node.name: node.batch_size} if node.adaptive is not None else {}
+        report = {"batch_sizes": sizes, "stats": {node.name: node._stats} if stats else {}}
+        _stop_profile(profiler, report)
+        if reports is not None:
+            reports.put((_REPORT_SIGNAL, report))
+
+        if results is not None:
+            results.put(_CLOSE_SIGNAL)
+
+
+class StageExecutor(BaseExecutor):
+    """
+    Runs every node except the root in processes of its own, connected along the edges of the graph by bounded
+    queues, so slow stages are pipelined against each other and a heavy node is only copied as many times as it has
+    replicas. A node gets concurrency replicas unless the replicas argument says otherwise. Replicas of a node share its
+    input queue and each keeps its own state. Nodes with batch_size Node.BATCH_SIZE_ALL always have one replica.
+
+    The root is run by the calling process and n_threads is not used.
+    """
+    MAX_QUEUE_SIZE = 100
+    def __init__(self, graph, n_threads=1, quiet=False, replicas=None, chunk_size=1, chunk_bytes=None,
+                 chunk_latency=0.05, idle_wait=0.05, update_interval=0.5, result_buffer=64, stats=False, trace=False,
+                 ordered=False):
+        """
+        :param replicas: Number of processes to run for each node, by node name. Defaults to the node's concurrency
+        :type replicas: dict
+        :param chunk_size: Maximum number of items sent between stages in one queue put. See ParallelExecutor2 for the
+        other chunk, idle and result options
+        :type chunk_size: int
+        """
+        if trace:
+            raise Exception("StageExecutor cannot trace items. Use stats=True for per node stats")
+        if ordered:
+            raise Exception("StageExecutor cannot keep outputs in order. Use ParallelExecutor2 with ordered=True")
+
+        super().__init__(graph, quiet, stats)
+        self.plan = ExecutionPlan(graph)
+
+        replicas = replicas or {}
+        self.n_replicas = []
+        for node in self.plan.nodes:
+            n = replicas.get(node.name, node.concurrency)
+            if node.batch_size == float("inf"):
+                n = 1
+            self.n_replicas.append(n)
+        self.n_replicas[0] = 1
+
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.chunk_latency = chunk_latency
+
+        self.idle_wait = idle_wait
+        self.update_interval = update_interval
+        self.result_buffer = result_buffer
+
+        self._stop = threading.Event()
+        self._closes = None
+        self._report_queue = None
+        self._processes = []
+
+    def _run_root(self):
+        raise Exception("StageExecutor does not use _run_root or _step. These should not be called")
+
+    def _step(self):
+        raise Exception("StageExecutor does not use _run_root or _step. These should not be called")
+
+    def _start_stages(self, results=None):
+        plan = self.plan
+        queues = [None] + [multiprocessing.Queue(StageExecutor.MAX_QUEUE_SIZE) for j in range(1, plan.n_nodes)]
+
+        # Process.start drops its arguments, so the counters are kept here until the stages are done. Otherwise the
+        # shared memory of one could be handed out again for the next
+        self._closes = [multiprocessing.Value(ctypes.c_int, 0, lock=True) for j in range(plan.n_nodes)]
+
+        self._reports = []
+        self._report_queue = multiprocessing.Queue() if self._wants_reports() else None
+
+        processes = []
+        for j in range(1, plan.n_nodes):
+            out_queues = [(e, queues[plan.edge_dst[e]]) for e in plan.out_edges[j]]
+
+            for r in range(self.n_replicas[j]):
+                p = multiprocessing.Process(target=_stage_run, name=plan.nodes[j].name,
+                                            args=(plan, j, queues[j], out_queues, self._closes[j], self.n_replicas,
+                                                  self.quiet, results, self._report_queue, self.collect_stats,
+                                                  self.profiler))
+                p.start()
+                processes.append(p)
+
+        self._processes = processes
+        return queues, processes
+
+    def _failed(self):
+        # A stage that dies stops reading its queue, so the stages before it and the root would wait on it forever
+        for p in self._processes:
+            if p.exitcode is not None and p.exitcode != 0:
+                self._stop.set()
+                return p
+        return None
+
+    def _check_stages(self):
+        p = self._failed()
+        if p is not None:
+            raise Exception("Stage %s exited with code %s" % (p.name, p.exitcode))
+
+    def _end_stages(self, queues, processes):
+        self._stop.set()
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for q in queues[1:]:
+            q.cancel_join_thread()
+
+    def _put(self, q, chunk):
+        while not self._stop.is_set():
+            try:
+                q.put(chunk, timeout=self.update_interval)
+                return
+            except queue.Full:
+                self._failed()
+
+    def _send(self, queues, chunk):
+        plan = self.plan
+        values = [parcel.data for parcel in chunk]
+        for e in plan.out_edges[0]:
+            self._put(queues[plan.edge_dst[e]], plan.project(e, values))
+
+    def _feed(self, queues, report_progress=True):
+        root = self.graph._root
+        chunks = _ChunkBuffer(self.chunk_size, self.chunk_bytes, self.chunk_latency)
+
+        idle = 0
+        while root._state != STATE_CLOSED and not self._stop.is_set():
+            root.state_transition()
+            _call_root(root)
+
+            if len(root._output_buffer) > 0:
+                idle = 0
+                self.progress_current += len(root._output_buffer)
+
+                if not self.plan.out_edges[0]:
+                    self._sink(root, root._output_buffer)
+
+                for parcel in root._output_buffer:
+                    if chunks.add(parcel):
+                        self._send(queues, chunks.take())
+            elif root._state == STATE_RUNNING:
+                if idle > 0:
+                    time.sleep(min(self.idle_wait, 0.001 * 2 ** (idle - 1)))
+                idle += 1
+
+            if chunks.expired():
+                self._send(queues, chunks.take())
+
+            if report_progress:
+                self.update_progress()
+
+            root._output_buffer.clear()
+
+        if len(chunks) > 0:
+            self._send(queues, chunks.take())
+
+        if self._stop.is_set():
+            return
+
+        for e in self.plan.out_edges[0]:
+            queues[self.plan.edge_dst[e]].put(_CLOSE_SIGNAL)
+
+    def _wait_stages(self, processes):
+        running = [p.sentinel for p in processes]
+        reports = self._report_queue
+        timeout = self.update_interval if self.use_callback or reports is not None else None
+
+        while running:
+            for sentinel in multiprocessing.connection.wait(running, timeout=timeout):
+                running.remove(sentinel)
+            self._check_stages()
+
+            if reports is not None:
+                self._take_reports(reports, len(processes), [], block=False)
+            self.update_progress()
+
+        if reports is not None:
+            self._take_reports(reports, len(processes), processes)
+
+        for p in processes:
+            p.join()
+
+    def run(self, update_callback=None):
+        self._stop.clear()
+        self._init_update(update_callback)
+
+        queues, processes = self._start_stages()
+        try:
+            self._feed(queues)
+            self._check_stages()
+            self._wait_stages(processes)
+        except BaseException:
+            self._end_stages(queues, processes)
+            raise
+
+    def iter_results(self, update_callback=None):
+        self.collect = True
+        self._stop.clear()
+        self._init_update(update_callback)
 
+        results = multiprocessing.Queue(self.result_buffer)
+        queues, processes = self._start_stages(results)
+
+        if not processes:
+            # The root is the only node, so there is nothing to wait for
+            self._feed(queues)
+            yield from self.take_results()
+            return
+
+        feeder = threading.Thread(target=self._call, args=(self._feed, queues, False), daemon=True)
+        feeder.start()
+
+        n_done = 0
+        try:
+            while n_done < len(processes):
+                try:
+                    batch = results.get(timeout=self.update_interval)
+                except Empty:
+                    self._check_stages()
+                    self.update_progress()
+                    continue
+
+                if batch == _CLOSE_SIGNAL:
+                    n_done += 1
+                else:
+                    yield from batch
+
+                self.update_progress()
+
+            feeder.join()
+            self._wait_stages(processes)
+        finally:
+            self._end_stages(queues, processes)
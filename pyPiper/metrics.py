@@ -0,0 +1,112 @@
+import math
+
+
+class Histogram(object):
+    """
+    Counts of durations in buckets whose bounds grow by FACTOR, so a percentile is known to within that factor.
+    Histograms recorded by different processes are merged by adding up their counts.
+    """
+    FACTOR = 2 ** 0.25
+    # Upper bound of the first bucket, in seconds
+    SMALLEST = 1e-7
+
+    def __init__(self):
+        self.counts = {}
+        self.n = 0
+        self.max = 0.0
+
+    def add(self, value):
+        k = int(math.log(value / self.SMALLEST, self.FACTOR)) + 1 if value > self.SMALLEST else 0
+        self.counts[k] = self.counts.get(k, 0) + 1
+        self.n += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for k, count in other.counts.items():
+            self.counts[k] = self.counts.get(k, 0) + count
+        self.n += other.n
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q-th percentile, or None if nothing was recorded
+        """
+        if self.n == 0:
+            return None
+
+        target = max(1, math.ceil(q * self.n / 100))
+        seen = 0
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+            if seen >= target:
+                return min(self.SMALLEST * self.FACTOR ** k, self.max)
+
+
+class NodeStats(object):
+    """
+    What an executor recorded about one node during a run: its calls to run, the items they were given and emitted,
+    the seconds they took and the most items queued for the node at once.
+
+    When traced, also the seconds every item waited on the edge into the node, and the seconds from the root emitting
+    the item an input came from to the node being done with it.
+    """
+    def __init__(self, trace=False):
+        self.calls = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.time = 0.0
+        self.max_queued = 0
+        self.times = Histogram()
+        self.waits = Histogram() if trace else None
+        self.latency = Histogram() if trace else None
+
+    def record(self, n_in, n_out, seconds):
+        self.calls += 1
+        self.items_in += n_in
+        self.items_out += n_out
+        self.time += seconds
+        self.times.add(seconds)
+
+    def queued(self, n):
+        if n > self.max_queued:
+            self.max_queued = n
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.items_in += other.items_in
+        self.items_out += other.items_out
+        self.time += other.time
+        # Every process has queues of its own, so the deepest of them is kept
+        self.max_queued = max(self.max_queued, other.max_queued)
+        self.times.merge(other.times)
+
+        if other.waits is not None:
+            if self.waits is None:
+                self.waits, self.latency = Histogram(), Histogram()
+            self.waits.merge(other.waits)
+            self.latency.merge(other.latency)
+
+    def as_dict(self):
+        result = {"calls": self.calls, "items_in": self.items_in, "items_out": self.items_out, "time": self.time,
+                  "time_max": self.times.max, "max_queued": self.max_queued}
+
+        histograms = [("time", self.times)]
+        if self.waits is not None:
+            histograms += [("wait", self.waits), ("latency", self.latency)]
+
+        for name, histogram in histograms:
+            for q in (50, 90, 99):
+                result["%s_p%i" % (name, q)] = histogram.percentile(q)
+        return result
+
+
+def merge_stats(parts):
+    """
+    Merges dicts of NodeStats by node name
+    """
+    totals = {}
+    for part in parts:
+        for name, stats in part.items():
+            totals.setdefault(name, NodeStats()).merge(stats)
+    return totals
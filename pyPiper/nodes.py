@@ -1,3 +1,4 @@
+import asyncio
 import os
 
 from pyPiper import Node, Pipeline
@@ -5,6 +6,7 @@ from tqdm import tqdm
 
 import time
 import random
+import zlib
 
 class Generate(Node):
     def setup(self, size, reverse=False):
@@ -42,6 +44,21 @@ class EvenOddGenerate(Node):
         else:
             self.close()
 
+class TrickleGenerate(Node):
+    def setup(self, size, delay):
+        self.size = size
+        self.delay = delay
+        self.pos = 0
+        self.next_time = 0
+
+    def run(self, data):
+        if self.pos >= self.size:
+            self.close()
+        elif time.time() >= self.next_time:
+            self.emit(self.pos)
+            self.pos += 1
+            self.next_time = time.time() + self.delay
+
 class Square(Node):
     def run(self, data):
         self.emit(data**2)
@@ -56,6 +73,91 @@ class Sleep(Node):
         # time.sleep(1)
         self.emit(data)
 
+class SleepFor(Node):
+    def setup(self, delay):
+        self.delay = delay
+
+    def run(self, data):
+        time.sleep(self.delay)
+        self.emit(data)
+
+class SkewedSleep(Node):
+    def setup(self, slow, fast):
+        self.slow = slow
+        self.fast = fast
+
+    def run(self, data):
+        time.sleep(self.slow if data == 0 else self.fast)
+        self.emit((data, os.getpid()))
+
+class Checksum(Node):
+    def run(self, data):
+        self.emit((type(data).__name__, zlib.crc32(data)))
+
+class Remember(Node):
+    def setup(self):
+        self.seen = []
+
+    def run(self, data):
+        self.seen.append(data)
+        self.emit(len(self.seen))
+
+class Take(Node):
+    def setup(self, n):
+        self.n = n
+
+    def run(self, data):
+        self.emit(data)
+        self.n -= 1
+        if self.n == 0:
+            self.close()
+
+class Repeat(Node):
+    def setup(self, n):
+        self.n = n
+
+    def run(self, data):
+        self.emit_many([data] * self.n)
+
+class FailOn(Node):
+    def setup(self, value):
+        self.value = value
+
+    def run(self, data):
+        if data == self.value:
+            raise ValueError("Failed on %s" % data)
+        self.emit(data)
+
+class Collect(Node):
+    def run(self, data):
+        self.emit(list(data))
+
+class Overhead(Node):
+    def setup(self, per_call, per_item):
+        self.per_call = per_call
+        self.per_item = per_item
+
+    def run(self, data):
+        time.sleep(self.per_call + self.per_item * len(data))
+        self.emit_many(data)
+
+class ColumnSquare(Node):
+    def run(self, data):
+        self.emit_batch(data**2)
+
+class ColumnSumDiff(Node):
+    def run(self, data):
+        a, b = data
+        self.emit_batch((a + b, a - b))
+
+class AsyncSleep(Node):
+    def setup(self, delay):
+        self.delay = delay
+
+    async def run(self, data):
+        await asyncio.sleep(self.delay)
+        self.emit(data)
+
 class Half(Node):
     def run(self, data):
         self.emit(data/2.0)
@@ -0,0 +1,109 @@
+class ExecutionPlan(object):
+    """
+    Index based form of a NodeGraph, compiled once so executors do not have to walk the graph, build keys or look
+    up stream names while data is flowing.
+
+    Nodes are numbered in topological order with the root at 0. Edges are numbered in the order of their source node
+    so visiting edges by increasing id never visits an edge before the edge feeding its source.
+    """
+    def __init__(self, graph):
+        nodes = tuple(graph)
+        index = {node: i for i, node in enumerate(nodes)}
+
+        edge_src = []
+        edge_dst = []
+        out_edges = []
+        in_edge = [None] * len(nodes)
+
+        for i, node in enumerate(nodes):
+            ids = []
+            for successor in graph._graph[node]:
+                e = len(edge_src)
+                edge_src.append(i)
+                edge_dst.append(index[successor])
+                in_edge[index[successor]] = e
+                ids.append(e)
+            out_edges.append(tuple(ids))
+
+        self.graph = graph
+        self.nodes = nodes
+        self.edge_src = tuple(edge_src)
+        self.edge_dst = tuple(edge_dst)
+        self.out_edges = tuple(out_edges)
+        self.in_edge = tuple(in_edge)
+        self.successors = tuple(tuple(edge_dst[e] for e in ids) for ids in out_edges)
+        self.projections = tuple(_compile_projection(nodes[s], nodes[d]) for s, d in zip(edge_src, edge_dst))
+
+    @property
+    def n_nodes(self):
+        return len(self.nodes)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_src)
+
+    def is_sink(self, i):
+        return len(self.out_edges[i]) == 0
+
+    def project(self, e, values):
+        """
+        Returns the items the destination of edge e receives when its source emits values
+        """
+        return _apply_projection(self.projections[e], values, self.nodes[self.edge_src[e]],
+                                 self.nodes[self.edge_dst[e]])
+
+
+def _compile_projection(node, next_node):
+    """
+    None means data is passed through untouched. An int means the node emits unnamed streams and next_node expects
+    that many of them. Otherwise the projection is the tuple of output positions next_node reads from.
+    """
+    if next_node.in_streams == "*":
+        return None
+
+    if node.out_streams == "*":
+        return len(next_node.in_streams)
+
+    return tuple(node.out_streams.index(k) for k in next_node.in_streams)
+
+
+def _takes_rows(node):
+    return node.columnar and isinstance(node.in_streams, list) and len(node.in_streams) > 1
+
+
+def _apply_projection(projection, values, node, next_node):
+    """
+    Returns the items next_node receives when node emits values, given the projection compiled for the two. The
+    streams next_node reads are given as separate items, unless it is a columnar node reading several streams, which
+    gets one tuple per emitted row so its batches can be split into one column per stream.
+    """
+    if projection is None:
+        return values
+
+    rows = _takes_rows(next_node)
+    result = []
+    if isinstance(projection, int):
+        for data in values:
+            if not isinstance(data, (list, tuple)):
+                data = [data]
+
+            if len(data) != projection:
+                raise Exception("Node %s emits %i items, but next node (%s) expects %i" % (
+                    node, len(data), next_node, projection))
+
+            if rows:
+                result.append(tuple(data))
+            else:
+                result.extend(data)
+    else:
+        for data in values:
+            if not isinstance(data, (list, tuple)):
+                data = [data]
+
+            if rows:
+                result.append(tuple(data[k] for k in projection))
+            else:
+                for k in projection:
+                    result.append(data[k])
+
+    return result
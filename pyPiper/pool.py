@@ -0,0 +1,198 @@
+import copy
+import io
+import multiprocessing
+import pickle
+import traceback
+
+from pyPiper.executors import _child_run, _CLOSE_SIGNAL, _STOP_SIGNAL
+from pyPiper.pyPiper import FusedNode, Node
+
+
+class _PoolRoot(Node):
+    """
+    Stands in for the root in a worker's copy of the graph. Workers never run the root, they only need its name and
+    streams, so the real root and whatever data it holds are not sent.
+    """
+    def run(self, data):
+        raise Exception("The root of a pooled graph runs in the parent process")
+
+
+class _GraphPickler(pickle.Pickler):
+    def __init__(self, file, root, known):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.root = root
+        self.known = known
+
+    def persistent_id(self, obj):
+        if obj is self.root:
+            return "root", obj.name, obj.out_streams
+        if isinstance(obj, Node) and id(obj) in self.known:
+            return "node", id(obj)
+        return None
+
+
+class _GraphUnpickler(pickle.Unpickler):
+    def __init__(self, file, nodes):
+        super().__init__(file)
+        self.nodes = nodes
+        self.root = None
+
+    def persistent_load(self, pid):
+        if pid[0] == "root":
+            if self.root is None:
+                self.root = _PoolRoot(pid[1], out_streams=pid[2])
+            return self.root
+        return self.nodes[pid[1]]
+
+
+# Containers a node holds are copied for every run, so that what one run adds to them is not seen by the next
+_PER_RUN_TYPES = (list, dict, set, bytearray)
+
+
+def _fresh_node(node):
+    node = copy.copy(node)
+    for key, value in vars(node).items():
+        if type(value) in _PER_RUN_TYPES:
+            setattr(node, key, copy.copy(value))
+    node._output_buffer = []
+    node.input_buffer = []
+    node._state = Node.STATE_RUNNING
+    if isinstance(node, FusedNode):
+        node.nodes = [_fresh_node(n) for n in node.nodes]
+    return node
+
+
+def _fresh_graph(graph):
+    """
+    Returns a copy of graph made of shallow copies of its nodes, reset to the state they start a run in. Lists, dicts,
+    sets and bytearrays the nodes hold are copied too, so every run starts from the nodes as they were sent. Whatever
+    else a node set up, such as a loaded model, is shared with the cached node instead of being copied.
+    """
+    copies = {id(node): _fresh_node(node) for node in graph._node_list}
+
+    result = copy.copy(graph)
+    result._root = copies[id(graph._root)]
+    result._graph = {copies[id(node)]: {copies[id(s)] for s in successors}
+                     for node, successors in graph._graph.items()}
+    result._node_list = set(result._graph)
+    result._last_added = copies[id(graph._last_added)]
+    return result
+
+
+def _pool_run(control, tasks, results, count):
+    # Nodes sent by the parent, by the id they have in the parent. Later graphs refer to these instead of sending them
+    nodes = {}
+
+    while True:
+        job = control.get()
+        if job == _STOP_SIGNAL:
+            break
+
+        payload, collect, quiet, serializer, report, options = job
+        graph = None
+        try:
+            template, new_nodes = _GraphUnpickler(io.BytesIO(payload), nodes).load()
+            nodes.update(new_nodes)
+
+            graph = _fresh_graph(template)
+            _child_run(tasks, graph, count, quiet, results if collect else None, serializer=serializer,
+                       drain_on_error=True, reports=results if report else None, **options)
+        except Exception:
+            # Keep serving later runs, but leave nothing of this one in the queue for them
+            traceback.print_exc()
+            if graph is None:
+                while tasks.get() != _CLOSE_SIGNAL:
+                    pass
+        finally:
+            if not collect or graph is None:
+                results.put(_CLOSE_SIGNAL)
+
+
+class WorkerPool(object):
+    """
+    Worker processes that are started once and can run the graphs of many Pipelines, one at a time, so short
+    pipelines do not pay for starting processes and sending every node each run. Pass it to a Pipeline with
+    Pipeline(graph, pool=pool).
+
+    Every node is sent to the workers once, the first time a graph containing it is run, and workers keep their copy.
+    Later graphs containing the same node object refer to that copy, so whatever its setup loaded is not sent again.
+    Each run works on shallow copies of the cached nodes, with their lists, dicts, sets and bytearrays copied, so a run
+    gives the same results as the first one. Changes made to a node in the parent after it was first sent are not
+    seen by the workers. The root always runs in the parent and is never sent.
+    """
+    MAX_QUEUE_SIZE = 100
+
+    def __init__(self, n_threads, result_buffer=64):
+        """
+        :param n_threads: Number of worker processes
+        :type n_threads: int
+        :param result_buffer: When collecting results, the number of result batches workers may queue up before they
+        wait for the consumer
+        :type result_buffer: int
+        """
+        if n_threads < 1:
+            raise Exception("n_threads must be >=1. Got %s" % n_threads)
+
+        self.n_threads = n_threads
+
+        self.tasks = multiprocessing.Queue(WorkerPool.MAX_QUEUE_SIZE)
+        self.results = multiprocessing.Queue(result_buffer)
+
+        self._nodes = {}
+        self._busy = False
+
+        self.children = []
+        for i in range(n_threads):
+            control = multiprocessing.Queue()
+            count = multiprocessing.Value("i", 0, lock=True)
+            p = multiprocessing.Process(target=_pool_run, args=(control, self.tasks, self.results, count), daemon=True)
+            p.start()
+            self.children.append({"process": p, "queue": self.tasks, "control": control, "count": count})
+
+    def _start_job(self, graph, collect, quiet, serializer, report=False, **options):
+        # options are passed on to _child_run in every worker
+        if self._busy:
+            raise Exception("WorkerPool is already running a pipeline")
+
+        for c in self.children:
+            if not c["process"].is_alive():
+                raise Exception("A worker of the WorkerPool has exited. Create a new pool")
+
+        # A FusedNode is made anew for every Pipeline, so cache the nodes of its chain instead
+        nodes = []
+        for node in graph:
+            nodes.extend(node.nodes if isinstance(node, FusedNode) else [node])
+        new_nodes = {id(node): node for node in nodes if node is not graph._root and id(node) not in self._nodes}
+
+        f = io.BytesIO()
+        _GraphPickler(f, graph._root, self._nodes).dump((graph, new_nodes))
+        payload = f.getvalue()
+
+        # Keep the nodes alive so their ids are not reused by other nodes while workers hold them
+        self._nodes.update(new_nodes)
+
+        self._busy = True
+        for c in self.children:
+            c["count"].value = 0
+            c["control"].put((payload, collect, quiet, serializer, report, options))
+
+        return self.children
+
+    def _end_job(self):
+        self._busy = False
+
+    def close(self):
+        """
+        Stops the workers once they have finished the current pipeline
+        """
+        for c in self.children:
+            c["control"].put(_STOP_SIGNAL)
+
+        for c in self.children:
+            c["process"].join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
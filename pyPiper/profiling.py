@@ -0,0 +1,98 @@
+import cProfile
+import pstats
+import types
+
+
+class Profiler(object):
+    """
+    Profiles a run of a pipeline in every process taking part. The profiler given to the run is a template: the
+    parent, every worker process and, with ThreadExecutor, every thread running nodes profile with a copy of it. A copy
+    may be started and stopped many times, and what its result method returns is sent to the parent, which hands the
+    results of all of the copies to merge on the template.
+    """
+    def start(self):
+        raise NotImplementedError("Child classes must override start method")
+
+    def stop(self):
+        raise NotImplementedError("Child classes must override stop method")
+
+    def result(self):
+        raise NotImplementedError("Child classes must override result method")
+
+    def merge(self, results):
+        raise NotImplementedError("Child classes must override merge method")
+
+
+class CProfiler(Profiler):
+    """
+    Profiles with cProfile. The results are merged into one pstats.Stats. Calls of every node are listed as a function
+    named after the node, such as <node double>, so its time and the functions it called can be looked up by name.
+    """
+    def __init__(self):
+        self._profile = None
+
+    def start(self):
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def result(self):
+        if self._profile is None:
+            return {}
+
+        self._profile.create_stats()
+        return self._profile.stats
+
+    def merge(self, results):
+        stats = pstats.Stats()
+        for result in results:
+            if result:
+                stats.add(_RawStats(result))
+        return stats
+
+
+class _RawStats(object):
+    # What pstats.Stats loads from: an object with the stats of a profile, made by create_stats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+# Functions standing in for Node._run by (the function they copy, node name), so every copy of a node in a process
+# shares one. Profilers merge entries with the same name, file and line, so one per name is all that can be told apart
+_labelled = {}
+
+
+def _label_calls(nodes):
+    """
+    Makes the calls of every node show up in profiles under a function named after the node. The nodes of a chain run
+    as a FusedNode are labelled instead of the FusedNode, which takes the name of its last node.
+    """
+    for node in _expand(nodes):
+        run = type(node)._run
+        key = run, node.name
+        if key not in _labelled:
+            label = "<node %s>" % node.name
+            _labelled[key] = types.FunctionType(run.__code__.replace(co_name=label), run.__globals__, label,
+                                                run.__defaults__, run.__closure__)
+        node._run = types.MethodType(_labelled[key], node)
+
+
+def _unlabel_calls(nodes):
+    for node in _expand(nodes):
+        node.__dict__.pop("_run", None)
+
+
+def _expand(nodes):
+    # Imported here since pyPiper.pyPiper imports the executors, which import this module
+    from pyPiper.pyPiper import FusedNode
+    for node in nodes:
+        if isinstance(node, FusedNode):
+            yield from node.nodes
+        else:
+            yield node
@@ -1,7 +1,17 @@
 from abc import ABC, abstractmethod
+import copy
 import json
 
-from pyPiper.executors import Executor, ParallelExecutor, ParallelExecutor2
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyPiper.executors import Executor, ParallelExecutor, ParallelExecutor2, ThreadExecutor, AsyncExecutor, \
+    StageExecutor
+from pyPiper.adaptive import AdaptiveBatch
+from pyPiper.plan import _apply_projection, _compile_projection
+from pyPiper.profiling import CProfiler, _label_calls, _unlabel_calls
 
 class Pipeline():
     def __init__(self, graph, n_threads=1, quiet=False, exec_name="ParallelExecutor2", **kwargs):
@@ -9,24 +19,123 @@ class Pipeline():
             raise Exception("Graph must be a node graph. Got %s" % type(graph))
 
         self.graph = graph
-
-        if n_threads == 1:
+        self._profile = None
+
+        # Executors that run nodes one after another lose nothing by running a chain of nodes as one. Stats are
+        # recorded per node, so nodes are kept apart when they are wanted
+        name = exec_name.lower()
+        fuse = kwargs.pop("fuse", True) and not (kwargs.get("stats") or kwargs.get("trace"))
+        if fuse and not (name in ("async", "stage") or (n_threads > 1 and name == "thread")):
+            graph = graph.fused()
+
+        if kwargs.get("pool") is not None:
+            self._executor = ParallelExecutor2(graph, kwargs["pool"].n_threads, quiet, **kwargs)
+        elif n_threads >= 1 and exec_name.lower() == "async":
+            self._executor = AsyncExecutor(graph, n_threads, quiet, **kwargs)
+        elif n_threads >= 1 and exec_name.lower() == "stage":
+            self._executor = StageExecutor(graph, n_threads, quiet, **kwargs)
+        elif n_threads == 1:
             self._executor = Executor(graph, quiet,**kwargs)
         elif n_threads > 1:
             if exec_name.lower() == "parallelexecutor":
                 self._executor = ParallelExecutor(graph, n_threads, quiet, **kwargs)
             elif exec_name.lower() == "parallelexecutor2":
                 self._executor = ParallelExecutor2(graph, n_threads, quiet, **kwargs)
+            elif exec_name.lower() == "thread":
+                self._executor = ThreadExecutor(graph, n_threads, quiet, **kwargs)
             else:
                 raise Exception("Unknown executor %s" % exec_name)
         else:
             raise Exception("n_threads must be >=1. Got %s" % n_threads)
 
-    def run(self, update_callback=None):
+    def run(self, update_callback=None, collect=False, profile=None):
+        """
+        :param update_callback: Called with the number of items processed so far and the total number of items
+        :param collect: If True, outputs of sink nodes are returned as a list instead of being printed
+        :type collect: bool
+        :param profile: True to profile the run with cProfile in this process and every worker, a Profiler to profile
+        it with, or the name of a file to write the merged cProfile stats to. See profile_stats
+        :type profile: bool or str or Profiler
+        """
+        if profile is None or profile is False:
+            return self._run(update_callback, collect)
+
+        profiler = CProfiler() if profile is True or isinstance(profile, str) else profile
+        executor = self._executor
+        executor.profiler = profiler
+
+        nodes = executor._local_nodes()
+        _label_calls(nodes)
+        local = copy.copy(profiler)
+        local.start()
+        try:
+            return self._run(update_callback, collect)
+        finally:
+            local.stop()
+            _unlabel_calls(nodes)
+            executor.profiler = None
+
+            self._profile = profiler.merge([local.result()] + executor.profile_results())
+            if isinstance(profile, str):
+                self._profile.dump_stats(profile)
+
+    def _run(self, update_callback, collect):
+        if collect:
+            return list(self.iter_results(update_callback))
+
         self._executor.run(update_callback)
 
+    def profile_stats(self):
+        """
+        Returns the profile of the last run made with profile, merged from every process and thread that took part.
+        For cProfile, this is a pstats.Stats in which the calls of every node are listed as <node name>, so
+        profile_stats().print_callees("<node double>") shows where the node double spent its time
+        """
+        if self._profile is None:
+            raise Exception("No run was profiled. Pass profile=True to run")
+        return self._profile
+
+    def batch_sizes(self):
+        """
+        Returns the batch size each node with an adaptive batch size ended the last run with, by node name
+        """
+        return self._executor.batch_sizes()
+
+    def stats(self):
+        """
+        Returns what was recorded about every node in the last run, by node name. The Pipeline must have been created
+        with stats=True. Each node has a dict of:
+
+        - calls, items_in and items_out: calls to run, and the items they were given and emitted
+        - time: total seconds spent in run
+        - time_p50, time_p90, time_p99 and time_max: seconds per call. Percentiles are accurate to about 20%
+        - max_queued: the most items queued for the node at once
+
+        With several processes or threads, their numbers are added up, and time_max and max_queued are the largest
+        of them.
+        """
+        return self._executor.stats()
+
+    def iter_results(self, update_callback=None, with_names=False):
+        """
+        Runs the pipeline and yields the outputs of sink nodes as they are produced. Results are buffered in bounded
+        batches, so they can be consumed while the pipeline is still running.
+
+        :param update_callback: Called with the number of items processed so far and the total number of items
+        :param with_names: If True, yields (sink name, data) tuples instead of data
+        :type with_names: bool
+        """
+        for name, data in self._executor.iter_results(update_callback):
+            if with_names:
+                yield name, data
+            else:
+                yield data
+
 
 class _Parcel(object):
+    # origin is only set when items are traced. It is the time the root emitted the item the parcel came from
+    __slots__ = ("data", "origin")
+
     def __init__(self, data):
         self.data = data
 
@@ -42,6 +151,11 @@ class Node(ABC):
     STATE_CLOSING = 2
     STATE_CLOSED = 3
 
+    # Whether run is given every item ready for the node in one list instead of one item per call, when batch_size is 1
+    _runs_lists = False
+
+    # NodeStats the executor records into, when stats are recorded
+    _stats = None
 
     def __init__(self, name, in_streams="*", out_streams="*", **kwargs):
         """
@@ -51,7 +165,8 @@ class Node(ABC):
         :type in_streams: str or list of str
         :param out_streams: Name of the output streams
         :type out_streams: str or list of str
-        :param kwargs: Extra arguments, can be used to specify stateless. All other arguments are passed to setup
+        :param kwargs: Extra arguments, can be used to specify batch_size, concurrency, columnar, max_batch_latency and
+        adaptive. All other arguments are passed to setup
         """
 
         override = {}
@@ -61,6 +176,38 @@ class Node(ABC):
         else:
             self.batch_size = 1
 
+        # Number of calls to run that parallel executors may make at the same time. With threads, each concurrent call
+        # is made on a shallow copy of the node, so values shared between copies must be safe to use from several
+        # threads. StageExecutor runs this many processes for the node
+        if "concurrency" in kwargs:
+            override["concurrency"] = kwargs.get("concurrency")
+            kwargs.pop("concurrency")
+        else:
+            self.concurrency = 1
+
+        # Columnar nodes get each batch as a NumPy array, or as a tuple of arrays, one per stream, when they read
+        # several named streams
+        if "columnar" in kwargs:
+            override["columnar"] = kwargs.get("columnar")
+            kwargs.pop("columnar")
+        else:
+            self.columnar = False
+
+        # Seconds the oldest item of a partial batch may wait for the batch to fill before the node is run on what
+        # there is. Only used when batch_size is a number greater than 1 or adaptive
+        if "max_batch_latency" in kwargs:
+            override["max_batch_latency"] = kwargs.get("max_batch_latency")
+            kwargs.pop("max_batch_latency")
+        else:
+            self.max_batch_latency = None
+
+        # True or an AdaptiveBatch to have executors adjust batch_size while the node runs. The node keeps its own copy
+        if "adaptive" in kwargs:
+            override["adaptive"] = kwargs.get("adaptive")
+            kwargs.pop("adaptive")
+        else:
+            self.adaptive = None
+
         self.name = name
 
         self.size = None
@@ -92,6 +239,19 @@ class Node(ABC):
             self.__setattr__(k, override[k])
 
         assert self.batch_size > 0
+        assert self.concurrency > 0
+
+        if self.columnar and numpy is None:
+            raise Exception("%s is columnar, which needs NumPy to be installed" % str(self))
+
+        if self.adaptive is not None and self.adaptive is not False:
+            if self.batch_size == self.BATCH_SIZE_ALL:
+                raise Exception("%s cannot have an adaptive batch size with batch_size BATCH_SIZE_ALL" % str(self))
+
+            self.adaptive = AdaptiveBatch() if self.adaptive is True else copy.copy(self.adaptive)
+            self.batch_size = self.adaptive.start(self.batch_size)
+        else:
+            self.adaptive = None
 
         if hasattr(self, "stateless"):
             raise DeprecationWarning("%s is declared stateless. Stateless is deprecated and does not do anything" % str(self))
@@ -117,6 +277,14 @@ class Node(ABC):
     def __hash__(self):
         return hash(self.name)
 
+    def __getstate__(self):
+        # Profiling rebinds _run on the node, which is not sent along when the node is pickled or copied
+        if "_run" in self.__dict__:
+            state = dict(self.__dict__)
+            del state["_run"]
+            return state
+        return self.__dict__
+
     def setup(self, **kwargs):
         pass
 
@@ -130,9 +298,32 @@ class Node(ABC):
     def emit(self, data):
         self._output_buffer.append(_Parcel(data))
 
+    def emit_batch(self, array):
+        """
+        Emits every row of a NumPy array. Given a tuple or list of arrays, one per output stream, emits rows made of
+        their elements. Rows are converted to Python objects by NumPy in one go.
+
+        :param array: Array of rows, or one array per output stream
+        :type array: numpy.ndarray or tuple of numpy.ndarray
+        """
+        if isinstance(array, (list, tuple)):
+            rows = zip(*[column.tolist() for column in array])
+        else:
+            rows = array.tolist()
+
+        self.emit_many(rows)
+
+    def emit_many(self, iterable):
+        """
+        Emits every item of iterable, in order
+
+        :param iterable: Items to emit
+        """
+        self._output_buffer.extend(map(_Parcel, iterable))
+
     def _run(self, data):
         if self._state != self.STATE_CLOSED:
-            self.run(data)
+            return self.run(data)
 
     @abstractmethod
     def run(self, data):
@@ -239,6 +430,128 @@ class NodeGraph(object):
             to_iter.extend(self._graph[to_yield])
             yield to_yield
 
+    def _is_fusable(self, node):
+        return (node is not self._root and node.batch_size == 1 and node.concurrency == 1 and not node.columnar and
+                node.adaptive is None)
+
+    def fused(self):
+        """
+        Returns a copy of this graph where every linear chain of two or more nodes with batch_size 1 and concurrency 1
+        that are neither columnar nor adaptive, each feeding only the next one, is replaced by a FusedNode. The nodes
+        themselves are not copied.
+        """
+        replace = {}
+        for node in self:
+            if node in replace or not self._is_fusable(node):
+                continue
+
+            chain = [node]
+            while len(self._graph[chain[-1]]) == 1:
+                successor = next(iter(self._graph[chain[-1]]))
+                if not self._is_fusable(successor):
+                    break
+                chain.append(successor)
+
+            if len(chain) > 1:
+                fused = FusedNode(chain)
+                for n in chain:
+                    replace[n] = fused
+
+        result = NodeGraph(self._root)
+        for node in self:
+            for successor in self._graph[node]:
+                pred = replace.get(node, node)
+                succ = replace.get(successor, successor)
+                if pred is not succ:
+                    result._add_node(pred, succ)
+
+        result._last_added = replace.get(self._last_added, self._last_added)
+        return result
+
+
+class FusedNode(Node):
+    """
+    Runs a chain of nodes as one node. The items ready for the chain go through it at once, calling every node's run in
+    turn and handing its output buffer straight to the next, without queueing or copying them in between. It takes
+    the name of the last node of the chain, so results of a fused sink keep their name.
+
+    When a node of the chain closes itself, it is given none of the items left and the nodes after it are closed along
+    with the FusedNode, so the FusedNode's successors are closed as they would be for the last node. Items given to
+    the FusedNode from then on are dropped.
+    """
+    _runs_lists = True
+
+    def __init__(self, nodes):
+        """
+        :param nodes: Nodes of the chain, in order
+        :type nodes: list of Node
+        """
+        super().__init__(nodes[-1].name, in_streams=nodes[0].in_streams, out_streams=nodes[-1].out_streams)
+
+        self.nodes = nodes
+        self.projections = [_compile_projection(a, b) for a, b in zip(nodes, nodes[1:])]
+        self._stopped = False
+
+    def close(self):
+        super().close()
+        for node in self.nodes:
+            if node._state == self.STATE_RUNNING:
+                node.close()
+
+    def state_transition(self):
+        super().state_transition()
+        for node in self.nodes:
+            node.state_transition()
+
+    def _feed(self, node, data):
+        # Stops at the item that makes the node close itself. Nodes closed along with the FusedNode still take
+        # everything, as their last items
+        if node._state != self.STATE_RUNNING:
+            for d in data:
+                node._run(d)
+            return
+
+        for d in data:
+            node._run(d)
+            if node._state != self.STATE_RUNNING:
+                self._stopped = True
+                return
+
+    def run(self, data):
+        if self._stopped:
+            return
+
+        nodes = self.nodes
+        self._feed(nodes[0], data)
+
+        for k in range(1, len(nodes)):
+            previous, node = nodes[k - 1], nodes[k]
+            buffer = previous._output_buffer
+            if not buffer:
+                break
+
+            projection = self.projections[k - 1]
+            if projection is None:
+                self._feed(node, (parcel.data for parcel in buffer))
+            else:
+                self._feed(node, _apply_projection(projection, [parcel.data for parcel in buffer], previous, node))
+            buffer.clear()
+
+        # Hand the last node's parcels over without copying them
+        last = nodes[-1]
+        if last._output_buffer:
+            if self._output_buffer:
+                self._output_buffer.extend(last._output_buffer)
+                last._output_buffer.clear()
+            else:
+                self._output_buffer, last._output_buffer = last._output_buffer, self._output_buffer
+
+        if self._state == self.STATE_RUNNING:
+            for node in nodes:
+                if node._state != self.STATE_RUNNING:
+                    self.close()
+                    break
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,112 @@
+import pickle
+import struct
+import zlib
+
+_COUNT = struct.Struct("<I")
+_SIZE = struct.Struct("<Q")
+
+
+class Serializer(object):
+    """
+    Turns the list of items sent to or from a worker in one queue put into a payload and back. Only the items are
+    encoded, so parcels are rebuilt on the receiving side instead of being pickled one by one.
+    """
+    def dumps(self, values):
+        raise NotImplementedError("Child classes must override dumps method")
+
+    def loads(self, payload):
+        raise NotImplementedError("Child classes must override loads method")
+
+
+class TupleSerializer(Serializer):
+    """
+    Pickles the items as a single tuple with the highest pickle protocol
+    """
+    def dumps(self, values):
+        return pickle.dumps(tuple(values), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload):
+        return pickle.loads(payload)
+
+
+class Pickle5Serializer(Serializer):
+    """
+    Pickles the items with protocol 5 and keeps large buffers, such as the data of NumPy arrays, out of the pickle
+    stream. The buffers are joined after the stream into one payload, and arrays are rebuilt as views of it on the
+    receiving side instead of being copied out again. Since the payload is bytes, such arrays are read only.
+    """
+    def dumps(self, values):
+        buffers = []
+        header = pickle.dumps(tuple(values), protocol=5, buffer_callback=buffers.append)
+        parts = [header] + [b.raw() for b in buffers]
+
+        sizes = b"".join(_SIZE.pack(len(part) if k == 0 else part.nbytes) for k, part in enumerate(parts))
+        return b"".join([_COUNT.pack(len(parts)), sizes] + parts)
+
+    def loads(self, payload):
+        view = memoryview(payload)
+
+        n = _COUNT.unpack_from(view, 0)[0]
+        pos = _COUNT.size
+        sizes = [_SIZE.unpack_from(view, pos + _SIZE.size * k)[0] for k in range(n)]
+        pos += _SIZE.size * n
+
+        parts = []
+        for size in sizes:
+            parts.append(view[pos:pos + size])
+            pos += size
+
+        return pickle.loads(parts[0], buffers=parts[1:])
+
+
+class ZlibSerializer(Serializer):
+    """
+    Compresses the payload of another serializer with zlib once it reaches min_bytes. Worth it for large text
+    payloads, where pipes are slower than compressing.
+    """
+    def __init__(self, serializer=None, level=1, min_bytes=1024):
+        """
+        :param serializer: Serializer whose payloads are compressed. Defaults to TupleSerializer
+        :type serializer: Serializer
+        :param level: zlib compression level
+        :type level: int
+        :param min_bytes: Payloads smaller than this are sent uncompressed
+        :type min_bytes: int
+        """
+        self.serializer = serializer if serializer is not None else TupleSerializer()
+        self.level = level
+        self.min_bytes = min_bytes
+
+    def dumps(self, values):
+        payload = self.serializer.dumps(values)
+        if len(payload) < self.min_bytes:
+            return b"r" + payload
+
+        return b"z" + zlib.compress(payload, self.level)
+
+    def loads(self, payload):
+        if payload[:1] == b"z":
+            return self.serializer.loads(bytearray(zlib.decompress(memoryview(payload)[1:])))
+
+        return self.serializer.loads(memoryview(payload)[1:])
+
+
+SERIALIZERS = {
+    "tuple": TupleSerializer,
+    "pickle5": Pickle5Serializer,
+    "zlib": ZlibSerializer,
+}
+
+
+def get_serializer(serializer):
+    """
+    Returns None, meaning parcels are pickled as they are, for None. Otherwise returns serializer if it is a Serializer
+    or the built in serializer with that name
+    """
+    if serializer is None or isinstance(serializer, Serializer):
+        return serializer
+
+    if serializer not in SERIALIZERS:
+        raise Exception("Unknown serializer %s. Expected one of %s" % (serializer, ", ".join(SERIALIZERS)))
+
+    return SERIALIZERS[serializer]()
@@ -0,0 +1,150 @@
+import copy
+import os
+from itertools import islice
+
+from pyPiper.pyPiper import Node
+
+
+class Source(Node):
+    """
+    Root node that emits up to pull_size items every time it is run, so executors can move a whole block of items
+    through the graph per step instead of paying the scheduling cost for every item. Child classes implement
+    generate, which returns an iterable or is written as a generator.
+
+    Sources whose items can be split into independent parts implement shard, which lets ParallelExecutor2 run a part
+    of the source in every worker with shard=True instead of sending every item from the parent.
+    """
+    def __init__(self, name, out_streams="*", pull_size=1000, **kwargs):
+        """
+        :param name: Name of the node
+        :type name: str
+        :param out_streams: Name of the output streams
+        :type out_streams: str or list of str
+        :param pull_size: Maximum number of items emitted per call
+        :type pull_size: int
+        :param kwargs: Passed to setup
+        """
+        if pull_size < 1:
+            raise Exception("pull_size must be >= 1. Got %s" % pull_size)
+
+        self.pull_size = pull_size
+        self._iterator = None
+
+        super().__init__(name, out_streams=out_streams, **kwargs)
+
+    def __getstate__(self):
+        # Running generators cannot be pickled. Copies sent to worker processes never run the root
+        state = dict(super().__getstate__())
+        state["_iterator"] = None
+        return state
+
+    def generate(self):
+        raise NotImplementedError("Child classes must override generate method")
+
+    def shard(self, index, n_shards):
+        """
+        Returns a source that emits only the index-th of n_shards parts of this source's items, or None if the items
+        cannot be split. Between them the shards emit every item exactly once.
+
+        :param index: Which part to return, from 0 to n_shards - 1
+        :type index: int
+        :param n_shards: Number of parts the items are split into
+        :type n_shards: int
+        """
+        return None
+
+    def _copy_for_shard(self):
+        shard = copy.copy(self)
+        shard._iterator = None
+        shard._output_buffer = []
+        return shard
+
+    def run(self, data):
+        if self._iterator is None:
+            self._iterator = iter(self.generate())
+
+        items = list(islice(self._iterator, self.pull_size))
+        self.emit_many(items)
+
+        if len(items) < self.pull_size:
+            self.close()
+
+
+class IterSource(Source):
+    """
+    Source that emits the items of an iterable. If the iterable has a length it is used as the size for progress
+    updates.
+    """
+    def setup(self, iterable):
+        self.iterable = iterable
+
+        try:
+            self.size = len(iterable)
+        except TypeError:
+            pass
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        if iter(self.iterable) is self.iterable:
+            state["iterable"] = None
+        return state
+
+    def generate(self):
+        return self.iterable
+
+    def shard(self, index, n_shards):
+        # Only sequences can be split without going through the items. Iterators are left to the parent
+        try:
+            size = len(self.iterable)
+            part = self.iterable[index * size // n_shards:(index + 1) * size // n_shards]
+        except TypeError:
+            return None
+
+        shard = self._copy_for_shard()
+        shard.iterable = part
+        shard.size = len(part)
+        return shard
+
+
+class LineSource(Source):
+    """
+    Source that emits the lines of a text file, without their line endings. Shards read byte ranges of the file, and
+    a line belongs to the shard its first byte falls in.
+    """
+    def setup(self, path, encoding="utf-8", start=0, end=None):
+        """
+        :param path: Path of the file
+        :type path: str
+        :param encoding: Encoding of the file
+        :type encoding: str
+        :param start: Offset in bytes of the first line to read. A line that starts before it is skipped
+        :type start: int
+        :param end: If given, lines starting at or after this offset in bytes are not read
+        :type end: int
+        """
+        self.path = path
+        self.encoding = encoding
+        self.start = start
+        self.end = end
+
+    def generate(self):
+        with open(self.path, "rb") as f:
+            if self.start > 0:
+                # Skip the rest of a line that began in the previous range
+                f.seek(self.start - 1)
+                f.readline()
+
+            while self.end is None or f.tell() < self.end:
+                line = f.readline()
+                if not line:
+                    break
+                yield line.decode(self.encoding).rstrip("\r\n")
+
+    def shard(self, index, n_shards):
+        end = self.end if self.end is not None else os.path.getsize(self.path)
+        size = end - self.start
+
+        shard = self._copy_for_shard()
+        shard.start = self.start + index * size // n_shards
+        shard.end = self.start + (index + 1) * size // n_shards
+        return shard
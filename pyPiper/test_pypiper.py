@@ -1,8 +1,24 @@
 import unittest
 import sys
-
-from pyPiper import NodeGraph, Node, Pipeline
-from nodes import Generate, Double, Square, Printer, EvenOddGenerate, Sleep, TqdmUpdate
+import os
+import pickle
+import pstats
+import tempfile
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyPiper import NodeGraph, Node, Pipeline, IterSource, LineSource, WorkerPool, AdaptiveBatch
+from pyPiper.executors import Executor
+from pyPiper.plan import ExecutionPlan
+from pyPiper.pyPiper import _Parcel
+from pyPiper.pyPiper import FusedNode
+from pyPiper.serializers import Pickle5Serializer, ZlibSerializer
+from nodes import Generate, Double, Square, Printer, EvenOddGenerate, Sleep, SleepFor, SkewedSleep, Checksum, Remember, Take, Repeat, FailOn, Collect, Overhead, Half, ColumnSquare, ColumnSumDiff, AsyncSleep, TqdmUpdate, TrickleGenerate
 
 
 def get_output():
@@ -141,6 +157,30 @@ class PyPiperTests(unittest.TestCase):
 
         self.assertEquals(g, expected_g)
 
+    def test_plan(self):
+        gen = EvenOddGenerate("gen", size=4, out_streams=["even", "odd"])
+        double = Double("double", in_streams="odd", out_streams="num")
+        square = Square("square")
+        printer = Printer("printer")
+        plan = ExecutionPlan(gen | [double | printer, square])
+
+        self.assertEqual(plan.nodes[0], gen)
+        for e in range(plan.n_edges):
+            self.assertLess(plan.edge_src[e], plan.edge_dst[e])
+
+        e_double = plan.in_edge[plan.nodes.index(double)]
+        e_square = plan.in_edge[plan.nodes.index(square)]
+        self.assertEqual(plan.project(e_double, [[0, 1], [2, 3]]), [1, 3])
+        self.assertEqual(plan.project(e_square, [[0, 1], [2, 3]]), [[0, 1], [2, 3]])
+
+    def test_step_takes_every_batch(self):
+        # Workers of ParallelExecutor push a task's items and step once, so one step must run all of them
+        executor = Executor(Generate("gen", size=0) | Printer("printer", batch_size=2), quiet=False)
+        executor.push_root([_Parcel(x) for x in range(5)])
+        executor._step()
+
+        self.assertEqual(get_output(), [str((0, 1)), str((2, 3))])
+
     def test_double(self):
         gen = Generate("gen", size=10)
         double = Double("double")
@@ -179,6 +219,96 @@ class PyPiperTests(unittest.TestCase):
 
         self.assertCountEqual(output, expected_out)
 
+    def test_root_only(self):
+        p = Pipeline(NodeGraph(Generate("gen", size=5)), n_threads=2, exec_name="ParallelExecutor")
+        p.run()
+        self.assertEqual(get_output(), [str(x) for x in range(5)])
+
+        for exec_name in ["ParallelExecutor", "ParallelExecutor2"]:
+            p = Pipeline(NodeGraph(Generate("gen", size=5)), n_threads=2, exec_name=exec_name)
+            self.assertCountEqual(p.run(collect=True), list(range(5)), exec_name)
+
+    def test_trickle_batch(self):
+        gen = TrickleGenerate("gen", size=10, delay=0.001)
+        double = Double("double")
+        printer = Printer("printer", batch_size=3)
+        p = Pipeline(gen | double | printer)
+
+        p.run()
+        output = get_output()
+
+        expected_out = [str((0, 2, 4)), str((6, 8, 10)), str((12, 14, 16)), str((18,))]
+
+        self.assertEqual(output, expected_out)
+
+    def test_iter_source(self):
+        gen = IterSource("gen", iterable=range(25), pull_size=10)
+        double = Double("double")
+        p = Pipeline(gen | double)
+
+        progress = []
+        p.run(update_callback=lambda done, total: progress.append((done, total)))
+        output = get_output()
+
+        self.assertEqual(output, [str(x * 2) for x in range(25)])
+        self.assertEqual(progress[-1], (25, 25))
+
+    def test_iter_source_parallel2(self):
+        gen = IterSource("gen", iterable=(x for x in range(25)), pull_size=10)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, quiet=True)
+
+        progress = []
+        p.run(update_callback=lambda done, total: progress.append(done))
+
+        self.assertEqual(progress[-1], 25)
+
+    def test_sharded_source(self):
+        gen = IterSource("gen", iterable=range(100), pull_size=8)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=3, shard=True)
+
+        progress = []
+        self.assertCountEqual(p.run(update_callback=lambda done, total: progress.append((done, total)), collect=True),
+                              [x * 2 for x in range(100)])
+        self.assertEqual(progress[-1], (100, 100))
+
+        gen = IterSource("gen", iterable=(x for x in range(10)))
+        with self.assertRaises(Exception):
+            Pipeline(gen | Double("double"), n_threads=2, shard=True).run()
+
+    def test_line_source_shards(self):
+        lines = ["line %i" % i + "x" * (i % 7) for i in range(50)]
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(lines) + "\n")
+
+        try:
+            source = LineSource("lines", path=f.name)
+            for n_shards in range(1, 6):
+                output = []
+                for i in range(n_shards):
+                    output.extend(source.shard(i, n_shards).generate())
+                self.assertEqual(output, lines)
+
+            p = Pipeline(LineSource("lines", path=f.name) | SleepFor("echo", delay=0), n_threads=2, shard=True)
+            self.assertCountEqual(p.run(collect=True), lines)
+        finally:
+            os.remove(f.name)
+
+    def test_bounded_edges(self):
+        gen = Generate("gen", size=50)
+        double = Double("double")
+        printer = Printer("printer", batch_size=4)
+        p = Pipeline(gen | double | printer, edge_capacity=5, memory_budget=1000)
+
+        depths = []
+        p.run(update_callback=lambda done, total: depths.append(max(len(q) for q in p._executor.queues)))
+        output = get_output()
+
+        expected_out = [str(tuple(x * 2 for x in range(i, i + 4))) for i in range(0, 48, 4)] + [str((96, 98))]
+        self.assertEqual(output, expected_out)
+        self.assertLessEqual(max(depths), 5)
+
     def test_printer(self):
         gen = Generate("gen", size=10)
         printer = Printer("printer", batch_size=1)
@@ -415,6 +545,478 @@ class PyPiperTests(unittest.TestCase):
 
         self.assertCountEqual(output, expected_out)
 
+    def test_parallel2_chunked(self):
+        gen = Generate("gen", size=50)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, quiet=True, chunk_size=8)
+
+        progress = []
+        p.run(update_callback=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(progress[-1], (50, 50))
+
+    def test_parallel2_balance(self):
+        gen = Generate("gen", size=20)
+        work = SkewedSleep("work", slow=0.5, fast=0.01)
+        p = Pipeline(gen | work, n_threads=2)
+
+        results = p.run(collect=True)
+        self.assertCountEqual([data for data, pid in results], range(20))
+
+        # Whichever worker took the slow item should not have been handed half of the others
+        slow_pid = dict(results)[0]
+        self.assertLess(sum(1 for data, pid in results if pid == slow_pid), 10)
+
+    def test_ordered(self):
+        for exec_name, kwargs in [("ParallelExecutor2", {"chunk_size": 2}), ("ParallelExecutor2", {"chunk_size": 3}),
+                                  ("ParallelExecutor2", {"chunk_size": 2, "reorder_window": 2, "serializer": "tuple"}),
+                                  ("ParallelExecutor", {})]:
+            # The first item is the slowest, so every other one would come out ahead of it
+            work = SkewedSleep("work", slow=0.2, fast=0.005)
+            graph = Generate("gen", size=20) | work | Collect("collect", batch_size=2)
+            p = Pipeline(graph, n_threads=3, exec_name=exec_name, ordered=True, **kwargs)
+
+            batches = p.run(collect=True)
+            results = [data for batch in batches for data, pid in batch]
+            self.assertEqual(results, list(range(20)), exec_name)
+            if kwargs.get("chunk_size") == 2:
+                # Chunks hold whole batches, so ordering leaves them as they are
+                self.assertEqual([len(batch) for batch in batches], [2] * 10)
+
+        for exec_name in ("thread", "stage"):
+            self.assertRaises(Exception, Pipeline, Generate("gen", size=5) | Double("double"), n_threads=2,
+                              exec_name=exec_name, ordered=True)
+
+        # Batches would be cut to the chunk, and outputs of a node given every item only come once the root closes
+        self.assertRaises(Exception, Pipeline, Generate("gen", size=5) | Collect("collect", batch_size=2), n_threads=2,
+                          ordered=True)
+        for exec_name in ("ParallelExecutor", "ParallelExecutor2"):
+            graph = Generate("gen", size=5) | Collect("collect", batch_size=Node.BATCH_SIZE_ALL)
+            self.assertRaises(Exception, Pipeline, graph, n_threads=2, exec_name=exec_name, ordered=True)
+
+    def test_shared_memory(self):
+        items = [bytes([i]) * (2 ** 17) for i in range(10)] + [bytearray(b"small")]
+        expected = [(type(item).__name__, zlib.crc32(item)) for item in items]
+
+        for exec_name in ["ParallelExecutor", "ParallelExecutor2"]:
+            p = Pipeline(IterSource("gen", iterable=items, pull_size=3) | Checksum("checksum"), n_threads=2,
+                         exec_name=exec_name, shared_memory=True)
+            self.assertCountEqual(p.run(collect=True), expected)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_shared_memory_numpy(self):
+        items = [numpy.full((64, 512), i, dtype=numpy.float32) for i in range(10)]
+        expected = [("ndarray", zlib.crc32(item)) for item in items]
+
+        p = Pipeline(IterSource("gen", iterable=items) | Checksum("checksum"), n_threads=2, shared_memory=True,
+                     shared_memory_min_bytes=1024)
+        self.assertCountEqual(p.run(collect=True), expected)
+
+    def test_serializers(self):
+        for exec_name, kwargs in [("ParallelExecutor", {}), ("ParallelExecutor2", {"chunk_size": 4})]:
+            for serializer in ["tuple", "pickle5", "zlib", ZlibSerializer(Pickle5Serializer(), min_bytes=0)]:
+                gen = Generate("gen", size=30)
+                double = Double("double")
+                p = Pipeline(gen | double, n_threads=2, exec_name=exec_name, serializer=serializer, **kwargs)
+
+                self.assertCountEqual(p.run(collect=True), [x * 2 for x in range(30)])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_pickle5_numpy(self):
+        serializer = Pickle5Serializer()
+        values = [numpy.arange(12).reshape(3, 4), "text", numpy.ones(5)]
+
+        decoded = serializer.loads(pickle.loads(pickle.dumps(serializer.dumps(values))))
+        self.assertTrue((decoded[0] == values[0]).all())
+        self.assertEqual(decoded[1], "text")
+        self.assertTrue((decoded[2] == values[2]).all())
+
+    def test_worker_pool(self):
+        remember = Remember("remember")
+
+        with WorkerPool(1) as pool:
+            p = Pipeline(IterSource("gen", iterable=range(10)) | remember, pool=pool)
+            self.assertEqual(p.run(collect=True), list(range(1, 11)))
+
+            # The worker reuses its copy of remember, but what the first run remembered is not carried over
+            p = Pipeline(IterSource("gen", iterable=range(10)) | remember, pool=pool, chunk_size=4)
+            self.assertEqual(p.run(collect=True), list(range(1, 11)))
+
+            self.assertEqual(remember.seen, [])
+
+    def test_worker_pool_reuse(self):
+        with WorkerPool(2) as pool:
+            p = Pipeline(Generate("gen", size=100) | Double("double"), pool=pool)
+            for x in p.iter_results():
+                break
+
+            for i in range(3):
+                p = Pipeline(Generate("gen", size=20) | Double("double") | Square("square"), pool=pool)
+                self.assertCountEqual(p.run(collect=True), [(x * 2) ** 2 for x in range(20)])
+
+            p = Pipeline(Generate("gen", size=20) | Double("double"), pool=pool, quiet=True)
+            p.run()
+
+    def test_parallel2_slow_source(self):
+        gen = TrickleGenerate("gen", size=10, delay=0.02)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, quiet=True)
+
+        progress = []
+        start = time.time()
+        p.run(update_callback=lambda done, total: progress.append(done))
+
+        self.assertEqual(progress[-1], 10)
+        self.assertLess(time.time() - start, 1)
+
+    def test_iter_results(self):
+        gen = Generate("gen", size=10)
+        double = Double("double")
+        square = Square("square")
+        p = Pipeline(gen | [double, square])
+
+        results = list(p.iter_results(with_names=True))
+
+        expected = [("double", x * 2) for x in range(10)] + [("square", x ** 2) for x in range(10)]
+        self.assertCountEqual(results, expected)
+        self.assertEqual(get_output(), [""])
+
+    def test_collect_parallel(self):
+        gen = Generate("gen", size=30)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, exec_name="ParallelExecutor")
+
+        self.assertCountEqual(p.run(collect=True), [x * 2 for x in range(30)])
+
+    def test_collect_parallel2(self):
+        gen = Generate("gen", size=30)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, chunk_size=4, result_buffer=2, max_in_flight=8)
+
+        self.assertCountEqual(p.run(collect=True), [x * 2 for x in range(30)])
+
+    def test_iter_results_parallel2_early_exit(self):
+        gen = IterSource("gen", iterable=range(100000), pull_size=100)
+        double = Double("double")
+        p = Pipeline(gen | double, n_threads=2, chunk_size=100, result_buffer=2)
+
+        results = p.iter_results()
+        first = next(results)
+        results.close()
+
+        self.assertEqual(first % 2, 0)
+
+    def test_thread(self):
+        gen = EvenOddGenerate("gen", size=20, out_streams=["even", "odd"])
+        double = Double("double", out_streams="num", in_streams="even")
+        square = Square("square", out_streams="num", in_streams="odd", concurrency=3)
+        printer = Printer("printer", in_streams="num", batch_size=Node.BATCH_SIZE_ALL)
+        p = Pipeline(gen | [double | printer, square], n_threads=4, exec_name="thread")
+
+        progress = []
+        p.run(update_callback=lambda done, total: progress.append((done, total)))
+        output = get_output()
+
+        expected_out = [str([x * 2 for x in range(0, 20, 2)])] + [str((x + 1) ** 2) for x in range(0, 20, 2)]
+        self.assertCountEqual(output, expected_out)
+        self.assertEqual(progress[-1], (10, 20))
+
+    def test_thread_concurrency(self):
+        gen = Generate("gen", size=8)
+        sleeper = SleepFor("sleep", delay=0.1, concurrency=8)
+        p = Pipeline(gen | sleeper, n_threads=8, exec_name="thread")
+
+        start = time.time()
+        results = p.run(collect=True)
+
+        self.assertCountEqual(results, list(range(8)))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_thread_concurrency_after_root_closes(self):
+        # The root finishes long before the sleeper, which must still spread what is queued over its replicas
+        p = Pipeline(Generate("gen", size=40) | SleepFor("sleep", delay=0.05, concurrency=10), n_threads=10,
+                     exec_name="thread")
+
+        start = time.time()
+        results = p.run(collect=True)
+
+        self.assertCountEqual(results, list(range(40)))
+        self.assertLess(time.time() - start, 0.6)
+
+    def test_async(self):
+        gen = IterSource("gen", iterable=range(500), pull_size=50)
+        sleeper = AsyncSleep("sleep", delay=0.1, concurrency=500)
+        double = Double("double")
+        printer = Printer("printer", batch_size=Node.BATCH_SIZE_ALL)
+        p = Pipeline(gen | sleeper | double | printer, exec_name="async")
+
+        progress = []
+        start = time.time()
+        p.run(update_callback=lambda done, total: progress.append(done))
+        output = get_output()
+
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(len(output), 1)
+        self.assertCountEqual(eval(output[0]), [x * 2 for x in range(500)])
+        self.assertEqual(progress[-1], 500)
+
+    def test_async_more_items_than_concurrency(self):
+        p = Pipeline(Generate("gen", size=100) | AsyncSleep("sleep", delay=0.05, concurrency=10), exec_name="async")
+
+        start = time.time()
+        results = p.run(collect=True)
+
+        self.assertCountEqual(results, list(range(100)))
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_async_iter_results(self):
+        gen = Generate("gen", size=20)
+        sleeper = AsyncSleep("sleep", delay=0.01, concurrency=5)
+        p = Pipeline(gen | [sleeper, Square("square")], n_threads=2, exec_name="async")
+
+        results = list(p.iter_results(with_names=True))
+
+        expected = [("sleep", x) for x in range(20)] + [("square", x ** 2) for x in range(20)]
+        self.assertCountEqual(results, expected)
+
+    def test_stage(self):
+        gen = EvenOddGenerate("gen", size=40, out_streams=["even", "odd"])
+        double = Double("double", out_streams="num", in_streams="even", concurrency=3)
+        square = Square("square", out_streams="num", in_streams="odd")
+        gather = SleepFor("gather", delay=0, in_streams="num", batch_size=Node.BATCH_SIZE_ALL, concurrency=4)
+        p = Pipeline(gen | [double, square | gather], exec_name="stage", chunk_size=4, replicas={"square": 2})
+
+        n_replicas = dict(zip(p._executor.plan.nodes, p._executor.n_replicas))
+        self.assertEqual(n_replicas, {gen: 1, double: 3, square: 2, gather: 1})
+
+        results = list(p.iter_results(with_names=True))
+        doubled = [data for name, data in results if name == "double"]
+        gathered = [data for name, data in results if name == "gather"]
+
+        self.assertCountEqual(doubled, [x * 2 for x in range(0, 40, 2)])
+        self.assertEqual(len(gathered), 1)
+        self.assertCountEqual(gathered[0], [(x + 1) ** 2 for x in range(0, 40, 2)])
+
+    def test_stage_collect(self):
+        gen = Generate("gen", size=50)
+        double = Double("double", concurrency=3)
+        square = Square("square", concurrency=2)
+        p = Pipeline(gen | double | square, exec_name="stage", chunk_size=4)
+
+        progress = []
+        results = p.run(update_callback=lambda done, total: progress.append(done), collect=True)
+
+        self.assertCountEqual(results, [(x * 2) ** 2 for x in range(50)])
+        self.assertEqual(progress[-1], 50)
+
+    def test_worker_failure(self):
+        # Only the worker given item 3 fails, and the items it took must not be silently lost
+        for collect, kwargs in [(False, {}), (True, {}), (True, {"ordered": True})]:
+            graph = Generate("gen", size=2000) | FailOn("fail", value=3) | Double("double")
+            p = Pipeline(graph, n_threads=2, quiet=True, **kwargs)
+
+            start = time.time()
+            self.assertRaises(Exception, p.run, collect=collect)
+            self.assertLess(time.time() - start, 5)
+
+    def test_stage_failure(self):
+        # The failing stage stops reading its queue, which must not leave the run waiting on it
+        for collect in [False, True]:
+            graph = Generate("gen", size=2000) | FailOn("fail", value=3) | Double("double")
+            p = Pipeline(graph, exec_name="stage", quiet=True)
+
+            start = time.time()
+            self.assertRaises(Exception, p.run, collect=collect)
+            self.assertLess(time.time() - start, 5)
+
+    def test_fused_graph(self):
+        gen = EvenOddGenerate("gen", size=10, out_streams=["even", "odd"])
+        double = Double("double", in_streams="even", out_streams="num")
+        square = Square("square", in_streams="num")
+        half = Half("half")
+        printer = Printer("printer")
+        graph = gen | [double | square | half | printer, Square("odd", in_streams="odd")]
+
+        fused = graph.fused()
+        nodes = list(fused)
+        chains = [n for n in nodes if isinstance(n, FusedNode)]
+
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(len(chains), 1)
+        self.assertEqual(chains[0].nodes, [double, square, half])
+        self.assertEqual(chains[0].name, "half")
+        self.assertEqual(fused._graph[chains[0]], {printer})
+
+    def test_fused_results(self):
+        for exec_name, n_threads in [("ParallelExecutor2", 1), ("ParallelExecutor2", 2), ("ParallelExecutor", 2)]:
+            results = []
+            for fuse in [True, False]:
+                gen = EvenOddGenerate("gen", size=30, out_streams=["even", "odd"])
+                double = Double("double", in_streams="even", out_streams="num")
+                square = Square("square", in_streams="num", out_streams="num")
+                odd = Square("odd", in_streams="odd")
+                p = Pipeline(gen | [double | square | Half("half", in_streams="num"), odd], n_threads=n_threads,
+                             exec_name=exec_name, fuse=fuse)
+                results.append(sorted(p.run(collect=True)))
+
+            self.assertEqual(results[0], results[1])
+
+    def test_fused_close(self):
+        gen = Generate("gen", size=20)
+        double = Double("double")
+        take = Take("take", n=5)
+        square = Square("square")
+        p = Pipeline(gen | double | take | square, n_threads=1)
+
+        self.assertEqual(p.run(collect=True), [(x * 2) ** 2 for x in range(5)])
+        for node in [double, take, square]:
+            self.assertEqual(node._state, Node.STATE_CLOSED)
+
+    def test_fused_close_in_pull(self):
+        # The root hands the chain many items at once, and Take must not be given those after its n-th
+        for fuse in [True, False]:
+            gen = IterSource("gen", iterable=range(100), pull_size=50)
+            p = Pipeline(gen | Double("double") | Take("take", n=5) | Square("square"), fuse=fuse)
+
+            self.assertEqual(p.run(collect=True), [(x * 2) ** 2 for x in range(5)])
+
+    def test_node_closing_itself(self):
+        for exec_name in ["thread", "async", "stage"]:
+            graph = Generate("gen", size=20) | Double("double") | Take("take", n=5) | Square("square")
+            p = Pipeline(graph, n_threads=2, exec_name=exec_name)
+
+            self.assertCountEqual(p.run(collect=True), [(x * 2) ** 2 for x in range(5)], exec_name)
+
+    def test_max_batch_latency(self):
+        for exec_name, n_threads in [("ParallelExecutor2", 1), ("ParallelExecutor2", 2), ("ParallelExecutor", 2),
+                                     ("thread", 2), ("async", 1), ("stage", 1)]:
+            gen = TrickleGenerate("gen", size=6, delay=0.05)
+            collect = Collect("collect", batch_size=100, max_batch_latency=0.01)
+            p = Pipeline(gen | collect, n_threads=n_threads, exec_name=exec_name)
+
+            batches = p.run(collect=True)
+
+            self.assertGreater(len(batches), 1, exec_name)
+            self.assertEqual(sorted(x for batch in batches for x in batch), list(range(6)), exec_name)
+
+    def test_adaptive_batch(self):
+        gen = IterSource("gen", iterable=range(2000), pull_size=200)
+        work = Overhead("work", per_call=0.002, per_item=0, adaptive=AdaptiveBatch(max_size=256))
+        p = Pipeline(gen | work, n_threads=1)
+
+        self.assertEqual(sorted(p.run(collect=True)), list(range(2000)))
+        self.assertGreaterEqual(p.batch_sizes()["work"], 32)
+
+    def test_adaptive_batch_target(self):
+        for exec_name, n_threads, kwargs in [("ParallelExecutor2", 2, {"chunk_size": 32}), ("thread", 2, {}),
+                                             ("stage", 1, {"chunk_size": 32})]:
+            gen = IterSource("gen", iterable=range(600))
+            adaptive = AdaptiveBatch(max_size=64, target_latency=0.008)
+            work = Overhead("work", per_call=0, per_item=0.001, adaptive=adaptive, max_batch_latency=0.05)
+            p = Pipeline(gen | work, n_threads=n_threads, exec_name=exec_name, **kwargs)
+
+            self.assertEqual(sorted(p.run(collect=True)), list(range(600)), exec_name)
+            self.assertGreaterEqual(p.batch_sizes()["work"], 3, exec_name)
+            self.assertLessEqual(p.batch_sizes()["work"], 16, exec_name)
+
+    def test_stats(self):
+        for exec_name, n_threads in [("ParallelExecutor2", 1), ("ParallelExecutor2", 2), ("ParallelExecutor", 2),
+                                     ("thread", 2), ("async", 1), ("stage", 1)]:
+            gen = Generate("gen", size=50)
+            graph = gen | Double("double") | Square("square")
+            p = Pipeline(graph, n_threads=n_threads, exec_name=exec_name, quiet=True, stats=True)
+            p.run()
+
+            stats = p.stats()
+            self.assertEqual(stats["gen"]["items_out"], 50, exec_name)
+            self.assertEqual((stats["double"]["calls"], stats["double"]["items_in"]), (50, 50), exec_name)
+            self.assertEqual(stats["double"]["items_out"], 50, exec_name)
+            self.assertEqual(stats["square"]["items_in"], 50, exec_name)
+            self.assertGreaterEqual(stats["square"]["max_queued"], 1, exec_name)
+            self.assertLessEqual(stats["double"]["time_p50"], stats["double"]["time_max"], exec_name)
+
+        p = Pipeline(Generate("gen", size=5) | Double("double"), n_threads=1, quiet=True)
+        p.run()
+        self.assertRaises(Exception, p.stats)
+
+    def test_trace(self):
+        for exec_name, n_threads, kwargs in [("ParallelExecutor2", 1, {}), ("ParallelExecutor2", 2, {}),
+                                             ("ParallelExecutor2", 2, {"serializer": "tuple"}),
+                                             ("ParallelExecutor", 2, {"serializer": "tuple"}),
+                                             ("thread", 2, {}), ("async", 1, {})]:
+            gen = IterSource("gen", iterable=range(20))
+            graph = gen | SleepFor("sleep", delay=0.002) | Double("double") | Collect("collect", batch_size=5)
+            p = Pipeline(graph, n_threads=n_threads, exec_name=exec_name, trace=True, **kwargs)
+
+            self.assertEqual(sorted(x for batch in p.run(collect=True) for x in batch), [x * 2 for x in range(20)])
+
+            stats = p.stats()
+            self.assertEqual(stats["double"]["items_in"], 20, exec_name)
+            self.assertGreaterEqual(stats["sleep"]["latency_p50"], 0.002, exec_name)
+            self.assertGreaterEqual(stats["collect"]["latency_p99"], stats["sleep"]["latency_p50"], exec_name)
+            self.assertIsNotNone(stats["double"]["wait_p50"], exec_name)
+
+        self.assertRaises(Exception, Pipeline, Generate("gen", size=5) | Double("double"), exec_name="stage",
+                          trace=True)
+
+    def test_unknown_option(self):
+        graph = Generate("gen", size=5) | Double("double")
+        self.assertRaises(TypeError, Pipeline, graph, edge_capacty=1)
+        self.assertRaises(TypeError, Pipeline, graph, shard=True)
+        self.assertRaises(TypeError, Pipeline, graph, ordered=True)
+        self.assertRaises(TypeError, Pipeline, graph, n_threads=2, exec_name="ParallelExecutor", chunk_size=4)
+        self.assertRaises(TypeError, Pipeline, graph, n_threads=2, exec_name="thread", chunk_sise=4)
+
+    def test_profile(self):
+        for exec_name, n_threads in [("ParallelExecutor2", 1), ("ParallelExecutor2", 2), ("ParallelExecutor", 2),
+                                     ("thread", 2), ("stage", 1)]:
+            gen = Generate("gen", size=20)
+            p = Pipeline(gen | Double("double") | Square("square"), n_threads=n_threads, exec_name=exec_name)
+
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, "run.pstats")
+                self.assertEqual(sorted(p.run(collect=True, profile=path)), [(x * 2) ** 2 for x in range(20)])
+                calls = {func[2]: stat[1] for func, stat in pstats.Stats(path).stats.items()}
+
+            self.assertEqual(calls["<node double>"], 20, exec_name)
+            self.assertEqual(calls["<node square>"], 20, exec_name)
+            self.assertIn("<node gen>", calls, exec_name)
+            self.assertNotIn("_run", gen.__dict__, exec_name)
+            self.assertIsInstance(p.profile_stats(), pstats.Stats)
+
+        p = Pipeline(Generate("gen", size=5) | Double("double"), n_threads=1, quiet=True)
+        p.run()
+        self.assertRaises(Exception, p.profile_stats)
+
+    def test_emit_many(self):
+        for fuse in [True, False]:
+            gen = IterSource("gen", iterable=range(10), pull_size=4)
+            p = Pipeline(gen | Repeat("repeat", n=3) | Double("double"), n_threads=1, fuse=fuse)
+
+            self.assertEqual(p.run(collect=True), [x * 2 for x in range(10) for i in range(3)])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_columnar(self):
+        for n_threads in [1, 2]:
+            gen = Generate("gen", size=100)
+            square = ColumnSquare("square", batch_size=32, columnar=True)
+            p = Pipeline(gen | Double("double") | square, n_threads=n_threads)
+
+            results = p.run(collect=True)
+
+            self.assertEqual(sorted(results), [(x * 2) ** 2 for x in range(100)])
+            self.assertTrue(all(type(x) is int for x in results))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_columnar_streams(self):
+        gen = EvenOddGenerate("gen", size=20, out_streams=["even", "odd"])
+        sum_diff = ColumnSumDiff("sum_diff", in_streams=["odd", "even"], out_streams=["sum", "diff"], batch_size=3,
+                                 columnar=True)
+        diff = Double("diff", in_streams="diff")
+        p = Pipeline(gen | sum_diff | diff, n_threads=1)
+
+        self.assertEqual(p.run(collect=True), [2] * 10)
+
 
 if __name__ == '__main__':
     unittest.main(buffer=True)
@@ -0,0 +1,157 @@
+import weakref
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Segments a process has attached to, by name. Kept per process so a reused segment is only mapped once
+_attached = {}
+# Names of segments this process is done with that have not been returned to their owner yet
+_released = []
+
+
+class _SharedBuffer(object):
+    """
+    Handle sent through a queue in place of a buffer that was copied into a shared memory segment
+    """
+    def __init__(self, name, nbytes, kind, dtype=None, shape=None):
+        self.name = name
+        self.nbytes = nbytes
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+
+
+class SharedMemoryTransport(object):
+    """
+    Moves large buffers between processes through shared memory segments instead of pickling them through a pipe.
+    The process that packs data owns the segments. Receivers send a segment's name back on the free queue once
+    they are done with it, and the owner reuses it for later data.
+
+    NumPy arrays are received as arrays backed by the segment itself, which is released when the array and every view
+    of it have been garbage collected. bytes, bytearray and memoryview data are copied out of the segment once on
+    arrival since they cannot be tracked the same way, and the segment is released straight away.
+    """
+    def __init__(self, free_queue, min_bytes=2 ** 16):
+        """
+        :param free_queue: Queue on which receivers return the names of segments they are done with. It has to be
+        reachable from the receiving processes
+        :param min_bytes: Buffers smaller than this are left to be pickled
+        :type min_bytes: int
+        """
+        self.free_queue = free_queue
+        self.min_bytes = min_bytes
+
+        self._segments = {}
+        self._idle = []
+
+        # Receivers register the segments they attach to with the resource tracker. They have to share the owner's
+        # tracker, or theirs would unlink the segments when they exit
+        resource_tracker.ensure_running()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_segments"] = {}
+        state["_idle"] = []
+        return state
+
+    def _buffer(self, data):
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            if data.dtype.hasobject or data.nbytes < self.min_bytes:
+                return None
+            view = memoryview(numpy.ascontiguousarray(data)).cast("B")
+            return view, "ndarray", data.dtype, data.shape
+        if isinstance(data, (bytes, bytearray)):
+            if len(data) < self.min_bytes:
+                return None
+            return memoryview(data), type(data).__name__, None, None
+        if isinstance(data, memoryview):
+            if data.nbytes < self.min_bytes:
+                return None
+            view = data.cast("B") if data.c_contiguous else memoryview(data.tobytes())
+            return view, "memoryview", data.format, data.shape
+        return None
+
+    def _get_segment(self, nbytes):
+        while True:
+            try:
+                self._idle.append(self.free_queue.get_nowait())
+            except Empty:
+                break
+
+        best = None
+        for name in self._idle:
+            size = self._segments[name].size
+            if size >= nbytes and (best is None or size < self._segments[best].size):
+                best = name
+
+        if best is not None:
+            self._idle.remove(best)
+            return self._segments[best]
+
+        segment = SharedMemory(create=True, size=nbytes)
+        self._segments[segment.name] = segment
+        return segment
+
+    def pack(self, data):
+        """
+        Returns a handle for data if it is a buffer of at least min_bytes, which is then held in shared memory.
+        Anything else is returned unchanged
+        """
+        found = self._buffer(data)
+        if found is None:
+            return data
+
+        view, kind, dtype, shape = found
+        segment = self._get_segment(view.nbytes)
+        segment.buf[:view.nbytes] = view
+        return _SharedBuffer(segment.name, view.nbytes, kind, dtype, shape)
+
+    def unpack(self, data):
+        """
+        Returns the data a handle made by pack stands for. Anything else is returned unchanged
+        """
+        if not isinstance(data, _SharedBuffer):
+            return data
+
+        segment = _attached.get(data.name)
+        if segment is None:
+            segment = SharedMemory(name=data.name)
+            _attached[data.name] = segment
+
+        if data.kind == "ndarray":
+            result = numpy.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf)
+            # Only note the release here. The finalizer may run in the middle of a put on the free queue
+            weakref.finalize(result, _released.append, data.name)
+            return result
+
+        result = bytes(segment.buf[:data.nbytes])
+        if data.kind == "bytearray":
+            result = bytearray(result)
+        elif data.kind == "memoryview":
+            result = memoryview(result).cast(data.dtype, data.shape)
+
+        _released.append(data.name)
+        return result
+
+    def flush(self):
+        """
+        Returns the segments released since the last call to their owner
+        """
+        while _released:
+            self.free_queue.put(_released.pop())
+
+    def close(self):
+        """
+        Frees every segment this process owns. Receivers must be done with them
+        """
+        for segment in self._segments.values():
+            segment.close()
+            segment.unlink()
+
+        self._segments = {}
+        self._idle = []